@@ -5,5 +5,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# WhiteNoise only runs under WSGI, static files are served by ASGIStaticFilesHandler below
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
+
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler  # noqa: E402, needs the settings loaded
+
+application = ASGIStaticFilesHandler(application)
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'exploration.metrics.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,6 +61,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Under an ASGI server (core/asgi.py) static files are served by ASGIStaticFilesHandler: WhiteNoise is WSGI only
+# and a sync middleware would run every async view back on a single thread
+if get_config('SERVER_INTERFACE', 'wsgi') == 'asgi':
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'core.urls'
 
 # TO-DO: If in production, need to add the domain name here 
@@ -146,6 +152,29 @@ DATABASES = {
 
 }
 
+# Caches
+# Forecasts are memoized in the 'forecasts' cache, local to each worker by default.
+# FORECAST_CACHE_BACKEND=file shares them across workers and restarts through FORECAST_CACHE_LOCATION.
+FORECAST_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'exploration.forecast_cache.ForecastFileCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'forecasts': {
+        'BACKEND': FORECAST_CACHE_BACKENDS[get_config('FORECAST_CACHE_BACKEND', 'locmem')],
+        'LOCATION': get_config('FORECAST_CACHE_LOCATION', 'cache/forecasts'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': get_config('FORECAST_CACHE_MAX_ENTRIES', 200000, cast=int),
+        },
+    },
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.0/topics/i18n/
 
@@ -167,3 +196,9 @@ REST_FRAMEWORK = {
     ],
 
 }
+
+# Scheduled jobs of django_crontab (python manage.py crontab add): nightly precomputation of the forecasts
+CRONJOBS = [
+    (get_config('PRECOMPUTE_SCHEDULE', '0 2 * * *'), 'django.core.management.call_command', ['precompute_forecasts']),
+]
+CRONTAB_COMMAND_PREFIX = f'cd {BASE_DIR} &&'
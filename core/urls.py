@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include  # add this
 from rest_framework_jwt.views import obtain_jwt_token
+from exploration.metrics import metrics_view
 
 # main entrypoint of the apis is the /api/exploration
 urlpatterns = [
     path('admin/', admin.site.urls),  # Django admin route
     path('api/exploration/', include('exploration.urls')),
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scraping
 ]
@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from exploration.models import Forecast, TrainingJob
+
+
+@admin.register(TrainingJob)
+class TrainingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'col', 'status', 'epoch', 'epochs', 'mape', 'created_at', 'finished_at')
+    list_filter = ('col', 'status')
+
+
+@admin.register(Forecast)
+class ForecastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source', 'metric', 'customer_id', 'model_version', 'computed_at')
+    list_filter = ('source', 'metric')
+    search_fields = ('customer_id',)
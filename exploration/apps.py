@@ -3,3 +3,4 @@ from django.apps import AppConfig
 
 class ExplorationConfig(AppConfig):
     name = 'exploration'
+    default_auto_field = 'django.db.models.AutoField'
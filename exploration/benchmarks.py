@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import logging
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from django.test.utils import override_settings
+
+from core.utils import get_config
+from exploration.constants import LOOKBACK, PREDICTION_HORIZON, COL_ORDERS
+from exploration.utils import (find_missing_dates, per_customer_frame, forecast_batch, load_data,
+                               preprocess_all_data_streaming, preprocess_frame, preprocess_per_customer_data, load_customer_series,
+                               prepare_lstm_data, prepare_model, predict_new_values, predict_customers)
+
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_orders(rows, customers, days, seed=0):
+    """
+    Generate a bq-results shaped dataframe of orders, so the benchmarks do not need the Git LFS datasets.
+    """
+
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, days * 24 * 3600, rows)
+    created_at = pd.Timestamp('2019-01-01') + pd.to_timedelta(seconds, unit='s')
+
+    return pd.DataFrame({
+        'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'order_id': rng.choice(10 ** 9, rows, replace=False),
+        'total_order_value': np.round(rng.gamma(2.0, 5.0, rows), 2),
+        'visitor_type': rng.choice(['Returning Visitor', 'New Visitor'], rows, p=[0.8, 0.2]),
+        'customer_id': rng.integers(10 ** 8, 10 ** 8 + customers, rows),
+        'platform': rng.choice(['android', 'ios', 'web'], rows),
+        'vendor_id': rng.integers(1, 1000, rows),
+        'business_type': 'Food',
+        'zipcode': rng.integers(10000, 19999, rows),
+        'cash': rng.random(rows) < 0.3,
+        'has_coupon': rng.random(rows) < 0.1,
+        'channel': 'Web',
+    })
+
+
+def legacy_per_customer_frame(df, col, operation_type, all_days):
+    """
+    The per customer loop that preprocess_per_customer_data used before it was vectorized, kept as a reference.
+    """
+
+    output = []
+    for unique_customer in [str(i) for i in set(df['customer_id'])]:
+        current_customer_data = df[(df.customer_id == int(unique_customer))].groupby('created_at')[col].agg(operation_type).to_dict()
+        final_customer_data = {i:0.0 for i in all_days}
+        for i,j in current_customer_data.items():
+            if i in final_customer_data:
+                final_customer_data[i] = j
+        output.append(pd.DataFrame.from_dict(final_customer_data, orient='index', columns=[unique_customer]))
+
+    output = pd.concat(output, axis=1)
+    output.reset_index(inplace=True)
+    return output.rename(columns = {'index':'created_at'})
+
+
+def benchmark_per_customer(rows, customers, days, col='order_id', operation_type='count', legacy=True):
+    """
+    Time the vectorized per customer aggregation against the legacy loop and check that both give the same frame.
+    """
+
+    df = synthetic_orders(rows, customers, days)
+    all_days = find_missing_dates(df)
+
+    start = time.perf_counter()
+    output = per_customer_frame(df, col, operation_type, all_days)
+    results = {'rows': rows, 'customers': customers, 'days': days, 'vectorized_s': time.perf_counter() - start}
+
+    if legacy:
+        start = time.perf_counter()
+        reference = legacy_per_customer_frame(df, col, operation_type, all_days)
+        results['legacy_s'] = time.perf_counter() - start
+        results['speedup'] = results['legacy_s'] / results['vectorized_s']
+
+        reference = reference[output.columns].astype({i: 'float64' for i in output.columns[1:]})
+        pd.testing.assert_frame_equal(output, reference, check_exact=True)
+
+    logger.info(f"Per customer benchmark: {results}")
+    return results
+
+
+def backtest_forecast_modes(model, store, num_prediction, customers=1000, origins=5, seed=0):
+    """
+    Backtest the recursive and direct forecast modes on the series of a random sample of customers of a CustomerSeriesStore:
+    forecasts of num_prediction days from the last origins days with a full window and horizon, compared with the known days.
+    Returns one row per mode with the forward passes, the forecast time, the per customer MAE and the MAPE
+    of the total of the sample per day.
+    """
+
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(store), min(customers, len(store)), replace=False))
+    series = store.dense(rows)
+    last_origin = store.n_days - num_prediction
+    origin_days = [t for t in range(last_origin, last_origin - origins, -1) if t >= LOOKBACK]
+    if not origin_days:
+        raise ValueError(f"Not enough days to backtest {num_prediction} days ahead")
+
+    results = []
+    for mode in ['recursive', 'direct']:
+        calls = []
+
+        def counted(x, training=False):
+            calls.append(len(x))
+            return model(x, training=training)
+
+        elapsed, errors, totals = 0.0, [], []
+        for t in origin_days:
+            actual = series[:, t : t + num_prediction]
+            start = time.perf_counter()
+            predictions = forecast_batch(counted, series[:, t - LOOKBACK : t], store.mins[rows], store.maxs[rows],
+                                         num_prediction, mode)[:, 1:]
+            elapsed += time.perf_counter() - start
+            errors.append(np.abs(predictions - actual).mean())
+            totals.append(np.abs(predictions.sum(axis=0) - actual.sum(axis=0)) / np.maximum(np.abs(actual.sum(axis=0)), 1e-9))
+
+        results.append({
+            'mode': mode,
+            'customers': len(rows),
+            'origins': len(origin_days),
+            'horizon': num_prediction,
+            'forward_passes': len(calls) // len(origin_days),
+            'seconds': round(elapsed / len(origin_days), 4),
+            'customer_mae': float(np.mean(errors)),
+            'total_mape': float(np.mean(totals)),
+        })
+
+    logger.info(f"Forecast modes backtest: {results}")
+    return results
+
+
+# Forecasts are computed on every call while benchmarking, never served from the forecast cache
+NO_FORECAST_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'forecasts': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def measure(function, repeat=3):
+    """
+    Best wall time of repeat calls of function, and the peak of the memory allocated by one traced call
+    (python and numpy allocations, tensorflow buffers are not traced). Returns the result of the last call too.
+    """
+
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+
+    return {'seconds': round(min(timings), 5), 'peak_memory_mb': round(peak / 2 ** 20, 2)}, result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(rows, customers, days, epochs=2, repeat=3, seed=0):
+    """
+    Time the preprocessing, training and forecasting hot paths on a synthetic bq-results shaped csv.
+    Everything runs in a temporary directory, so the served models and the cache are left untouched.
+    Returns a json serializable report.
+    """
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, override_settings(CACHES=NO_FORECAST_CACHE):
+        dir_name = os.path.join(workdir, 'datasets')
+        os.makedirs(dir_name)
+        synthetic_orders(rows, customers, days, seed).to_csv(os.path.join(dir_name, 'bq-results.csv'), index=False)
+        os.chdir(workdir)
+        try:
+            results['load_data'], df = measure(lambda: load_data(dir_name, 'bq-results.csv'), repeat)
+            # The in-memory pandas path, whatever PREPROCESS_CHUNKSIZE is set to
+            results['preprocess_all_data'], df_lstm = measure(
+                lambda: preprocess_frame(load_data(dir_name, 'bq-results.csv')), repeat)
+            results['preprocess_all_data_streaming'], _ = measure(
+                lambda: preprocess_all_data_streaming(dir_name, 'bq-results.csv', max(rows // 10, 1)), repeat)
+            results['preprocess_per_customer_data'], per_customer = measure(
+                lambda: preprocess_per_customer_data(dir_name, 'bq-results.csv', COL_ORDERS, 'count'), repeat)
+
+            # Windows of every customer series one after the other, copied into the contiguous arrays a training consumes
+            series = per_customer.drop(columns='created_at').to_numpy().T.reshape((-1, 1))
+            results['prepare_lstm_data'], _ = measure(
+                lambda: [np.ascontiguousarray(i) for i in prepare_lstm_data(series, LOOKBACK, PREDICTION_HORIZON)], repeat)
+
+            # Training saves model_order_id.h5 in the temporary directory, the forecasts below use it
+            training, _ = measure(lambda: prepare_model(df_lstm, COL_ORDERS, get_config('NEURONS_GEN_ORDERS', 50, cast=int), epochs,
+                                                        get_config('BATCH_SIZE_GEN_ORDERS', 1, cast=int), LOOKBACK, PREDICTION_HORIZON), 1)
+            results['prepare_model_per_epoch'] = dict(training, seconds=round(training['seconds'] / epochs, 5))
+
+            store = load_customer_series(dir_name, 'bq-results.csv', COL_ORDERS, 'count')
+            customer = f"{store.customer_ids[0]}:{COL_ORDERS}"
+            results['predict_new_values_single'], _ = measure(lambda: predict_new_values(customer, store), repeat)
+            results['predict_new_values_all_days'], _ = measure(lambda: predict_new_values(COL_ORDERS, df_lstm), repeat)
+            results['predict_customers_all'], _ = measure(lambda: predict_customers(COL_ORDERS, store), repeat)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': pd.Timestamp.now(tz='UTC').isoformat(),
+        'parameters': {'rows': rows, 'customers': customers, 'days': days, 'epochs': epochs, 'repeat': repeat, 'seed': seed},
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+                        'cpus': os.cpu_count(), 'inference_backend': get_config('INFERENCE_BACKEND', 'keras')},
+        'results': results,
+    }
+    logger.info(f"Benchmarks: {json.dumps(results)}")
+    return report
+
+
+def compare_reports(report, baseline, threshold=1.2, min_seconds=0.001):
+    """
+    Compare the timings of a report with a baseline report: a benchmark regresses when it is threshold times slower,
+    and by more than min_seconds so that the noise of sub-millisecond timings is ignored.
+    Returns one row per benchmark found in both reports.
+    """
+
+    rows = []
+    for name, result in report['results'].items():
+        if name not in baseline.get('results', {}):
+            continue
+        reference = baseline['results'][name]['seconds']
+        ratio = result['seconds'] / reference if reference else float('inf')
+        rows.append({'benchmark': name, 'baseline_s': reference, 'seconds': result['seconds'],
+                     'ratio': round(ratio, 3), 'regression': ratio > threshold and result['seconds'] - reference > min_seconds})
+    return rows
@@ -0,0 +1,299 @@
+import os
+import json
+import fcntl
+import hashlib
+import shutil
+import logging
+import threading
+from contextlib import contextmanager, ExitStack
+
+import pandas as pd
+
+from core.utils import get_config
+
+
+logger = logging.getLogger(__name__)
+
+# In-process copy of the artifacts already read by this worker: (source path, artifact name) -> (stat fingerprint, frame)
+_memory = {}
+# Thread lock of each artifact, (source path, artifact name) -> lock, created under _lock
+_locks = {}
+_lock = threading.Lock()
+
+
+def cache_dir():
+    """
+    Directory holding the derived artifacts, configurable in .env through CACHE_DIR.
+    """
+
+    path = os.path.join(os.getcwd(), get_config('CACHE_DIR', 'cache'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def source_path(dir_name, filename):
+    """
+    Absolute path of an input file, resolved the same way as load_data.
+    """
+
+    return os.path.join(os.getcwd(), dir_name, filename)
+
+
+def stat_fingerprint(path):
+    """
+    Cheap fingerprint of a file (size and modification time), checked on every request.
+    """
+
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def range_digest(path, begin=0, end=None, block_size=1024 * 1024):
+    """
+    sha256 of the bytes [begin, end) of a file, up to the end of the file by default.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        remaining = float('inf') if end is None else end - begin
+        while remaining > 0:
+            block = f.read(int(min(block_size, remaining)))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+def chain_digest(previous, path, offset):
+    """
+    Digest of a file after appending to it: the digest of its first offset bytes chained with the digest of the rest,
+    so that only the appended bytes are read.
+    """
+
+    return hashlib.sha256((previous + range_digest(path, offset)).encode('utf-8')).hexdigest()
+
+
+def content_digest(path, segments=None):
+    """
+    sha256 of the file contents, only computed when the stat fingerprint has changed.
+    A file grown by appends (segments holds its size before each append) is hashed as a chain of digests.
+    """
+
+    segments = segments or []
+    if not segments:
+        return range_digest(path)
+
+    digest = range_digest(path, 0, segments[0])
+    for begin, end in zip(segments, segments[1:] + [None]):
+        digest = hashlib.sha256((digest + range_digest(path, begin, end)).encode('utf-8')).hexdigest()
+    return digest
+
+
+def artifact_paths(path, name, partitioned=False):
+    """
+    Location of the parquet artifact (a directory of parquet files, one per day, when partitioned),
+    its json metadata and the lock file shared by all workers.
+    """
+
+    base = os.path.join(cache_dir(), f"{os.path.basename(path)}.{name}")
+    return base + ('.parts' if partitioned else '.parquet'), base + '.json', base + '.lock'
+
+
+def read_metadata(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_metadata(meta_path, meta):
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def write_frame(data_path, df):
+    # Hidden temporary file, parquet readers of a partition directory skip it
+    tmp_path = os.path.join(os.path.dirname(data_path), f".{os.path.basename(data_path)}.{os.getpid()}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, data_path)
+
+
+def partition_name(value):
+    return str(pd.Timestamp(value).date())
+
+
+def write_partitions(data_path, df, column):
+    """
+    Write df as one parquet file per day of column in the directory data_path, replacing the files of those days only.
+    """
+
+    os.makedirs(data_path, exist_ok=True)
+    if df.empty:
+        # Keeps the columns of an artifact without rows
+        write_frame(os.path.join(data_path, 'empty.parquet'), df)
+    for value, part in df.groupby(column):
+        write_frame(os.path.join(data_path, partition_name(value) + '.parquet'), part)
+
+
+def replace_partitions(data_path, df, column):
+    """
+    Replace all the partitions of an artifact with those of df, swapping the directories.
+    """
+
+    tmp_path = f"{data_path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    write_partitions(tmp_path, df, column)
+    if os.path.exists(data_path):
+        old_path = f"{data_path}.{os.getpid()}.old"
+        os.rename(data_path, old_path)
+        os.rename(tmp_path, data_path)
+        shutil.rmtree(old_path)
+    else:
+        os.rename(tmp_path, data_path)
+
+
+def artifact_lock(key):
+    """
+    Thread lock of one artifact: a rebuild only holds back the requests that need the same artifact.
+    """
+
+    with _lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def update_stored_artifact(path, name, builder, fingerprint, partition):
+    """
+    Bring the stored artifact up to date, the caller holds its locks. Returns the frame when it had to be built
+    with builder(), None when the stored one is current.
+    """
+
+    data_path, meta_path, lock_path = artifact_paths(path, name, partition is not None)
+    meta = read_metadata(meta_path)
+    digest = None
+    if meta is not None and os.path.exists(data_path):
+        if meta['size'] == fingerprint['size'] and meta['mtime_ns'] == fingerprint['mtime_ns']:
+            return None
+        digest = content_digest(path, meta.get('segments'))
+        if meta['sha256'] == digest:
+            # Same content with a new mtime (e.g. a fresh checkout), keep the artifact
+            write_metadata(meta_path, dict(meta, **fingerprint))
+            return None
+
+    logger.info(f"Building cached {name} for {os.path.basename(path)}.")
+    if digest is None or meta.get('segments'):
+        digest = content_digest(path)
+    df = builder()
+    if partition is None:
+        write_frame(data_path, df)
+    else:
+        replace_partitions(data_path, df, partition)
+    write_metadata(meta_path, dict(fingerprint, sha256=digest))
+    return df
+
+
+@contextmanager
+def locked_artifact(key, lock_path):
+    with artifact_lock(key), open(lock_path, 'w') as lock_file:
+        # Only one worker rebuilds, the others wait and read the fresh artifact
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cached_frame(path, name, builder, partition=None):
+    """
+    Return the artifact `name` derived from the file at `path`, building it with `builder()` only when the source changed.
+    The artifact is stored as parquet next to a json sidecar with the size, mtime and content hash of the source,
+    so it is shared between requests and gunicorn workers. With partition (a day column), it is stored as one
+    parquet file per day, so that appending to the source only rewrites the files of the days it touches.
+    """
+
+    fingerprint = stat_fingerprint(path)
+    key = (path, name)
+
+    entry = _memory.get(key)
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1].copy()
+
+    data_path, meta_path, lock_path = artifact_paths(path, name, partition is not None)
+    with locked_artifact(key, lock_path):
+        df = update_stored_artifact(path, name, builder, fingerprint, partition)
+        if df is None:
+            df = pd.read_parquet(data_path)
+        _memory[key] = (fingerprint, df)
+
+    return df.copy()
+
+
+def refresh_artifact(path, name, builder, partition=None):
+    """
+    Bring the artifact `name` of the file at `path` up to date as cached_frame does, without reading it
+    when it is current.
+    """
+
+    fingerprint = stat_fingerprint(path)
+    key = (path, name)
+
+    entry = _memory.get(key)
+    if entry is not None and entry[0] == fingerprint:
+        return
+
+    with locked_artifact(key, artifact_paths(path, name)[2]):
+        update_stored_artifact(path, name, builder, fingerprint, partition)
+
+
+@contextmanager
+def artifact_locks(path, names):
+    """
+    Hold the locks of several artifacts of a source file, e.g. while the file is appended to
+    and its artifacts updated, so that no worker rebuilds them in the meantime.
+    """
+
+    with ExitStack() as stack:
+        for name in sorted(names):
+            lock_file = stack.enter_context(open(artifact_paths(path, name)[2], 'w'))
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def replace_artifact(path, name, df, meta):
+    """
+    Replace an artifact updated in place, with the metadata of the new state of its source file.
+    The caller holds the artifact file lock, so the thread lock of the artifact is not taken here:
+    cached_frame holds it while waiting for that file lock.
+    """
+
+    data_path, meta_path, lock_path = artifact_paths(path, name)
+    write_frame(data_path, df)
+    write_metadata(meta_path, meta)
+    _memory[(path, name)] = ({'size': meta['size'], 'mtime_ns': meta['mtime_ns']}, df)
+
+
+def read_partitions(path, name, values):
+    """
+    Rows of the days of values in a partitioned artifact, None when none of them is stored.
+    """
+
+    data_path = artifact_paths(path, name, partitioned=True)[0]
+    files = [os.path.join(data_path, f'{day}.parquet') for day in sorted({partition_name(i) for i in values})]
+    frames = [pd.read_parquet(i) for i in files if os.path.exists(i)]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def update_partitions(path, name, df, column, meta):
+    """
+    Replace the partitions of the days of df in an artifact updated in place, and its metadata, as replace_artifact does.
+    The other days are left untouched, the full artifact is read again from disk by the next cached_frame.
+    """
+
+    data_path, meta_path, lock_path = artifact_paths(path, name, partitioned=True)
+    write_partitions(data_path, df, column)
+    write_metadata(meta_path, meta)
+    _memory.pop((path, name), None)
@@ -0,0 +1,128 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from core.utils import get_config
+
+
+# Output formats of the rendered charts and their content types
+IMAGE_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets downsampling of the series (x, y) to threshold points.
+    The first and last points are always kept, and each bucket in between keeps the point forming the largest
+    triangle with the point kept before it and the average of the next bucket, so peaks and dips survive.
+    """
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # threshold - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        begin, end = edges[i], edges[i + 1]
+        next_begin, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_begin:next_end].mean(), y[next_begin:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[begin:end] - y[a]) - (x[a] - x[begin:end]) * (avg_y - y[a]))
+        a = begin + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(x, y, max_points=None):
+    """
+    Series reduced to at most max_points points (PLOT_MAX_POINTS in .env) with lttb, x can hold dates.
+    """
+
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    numeric = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    keep = lttb(numeric, y, max_points or get_config('PLOT_MAX_POINTS', 2000, cast=int))
+    return x[keep], y[keep]
+
+
+def as_dates(values):
+    return pd.to_datetime(pd.Series(list(values))).to_numpy()
+
+
+def new_axes(figsize=(16, 6)):
+    """
+    A figure with its own Agg canvas and a single axes. Nothing goes through pyplot, so figures are never
+    registered globally and charts can be drawn by several threads at once.
+    """
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+
+def image_bytes(figure, fmt='png', dpi=100):
+    buf = io.BytesIO()
+    figure.savefig(buf, format=fmt, dpi=dpi)
+    return buf.getvalue()
+
+
+def history_chart(dates, series, title, fmt='png', dpi=100):
+    """
+    Known daily values of one or more series (a dict label -> values) against their dates.
+    """
+
+    figure, ax = new_axes()
+    dates = as_dates(dates)
+    for label, values in series.items():
+        ax.plot(*downsample(dates, values), label=label)
+
+    ax.set_xlabel('created_at')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=30)
+    ax.legend()
+    return image_bytes(figure, fmt, dpi)
+
+
+def actual_vs_predicted_chart(actual, predicted, label, fmt='png', dpi=100):
+    """
+    Actual and predicted values of the test days of a trained model.
+    """
+
+    figure, ax = new_axes()
+    ax.plot(*downsample(np.arange(len(actual)), actual), label=f'Actual {label}')
+    ax.plot(*downsample(np.arange(len(predicted)), predicted), label=f'Predicted {label}')
+
+    ax.set_ylabel(label.capitalize(), size=13)
+    ax.set_xlabel('Time Step (Days)', size=13)
+    ax.legend(fontsize=13)
+    figure.tight_layout()
+    return image_bytes(figure, fmt, dpi)
+
+
+def forecast_chart(dates, values, prediction_dates, predictions, label, title, fmt='png', dpi=100):
+    """
+    Known daily values of a series extended by its forecast, drawn dashed from the last known day.
+    """
+
+    figure, ax = new_axes()
+    line, = ax.plot(*downsample(as_dates(dates), values), label=label)
+    ax.plot(*downsample(as_dates(prediction_dates), predictions), linestyle='--', color=line.get_color(),
+            label=f'{label} forecast')
+
+    ax.set_xlabel('created_at')
+    ax.set_title(title)
+    ax.tick_params(axis='x', labelrotation=30)
+    ax.legend()
+    return image_bytes(figure, fmt, dpi)
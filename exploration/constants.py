@@ -7,5 +7,6 @@ LOOKBACK = 7
 PREDICTION_HORIZON = 7
 COL_ORDERS = 'order_id'
 COL_EARNINGS = 'total_order_value'
-
-
+MAX_FORECAST_HORIZON = 365
+SERIES_OPERATIONS = {COL_ORDERS: 'count', COL_EARNINGS: 'sum'}
+MAX_CUSTOMER_IDS = 1000
@@ -0,0 +1,75 @@
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastFileCache(FileBasedCache):
+    """
+    File based cache that culls old entries once every cull_every writes instead of on every write:
+    listing the cache directory for each of the thousands of forecasts of an export dominates its write time.
+    """
+
+    cull_every = 1000
+    _writes = 0
+
+    def _cull(self):
+        self._writes += 1
+        if self._writes % self.cull_every == 0:
+            super()._cull()
+
+
+def window_digest(window, data_min, data_max, last_date):
+    """
+    Digest of everything a forecast depends on in the input series: the last LOOKBACK values,
+    the min/max used for scaling and the last known day.
+    """
+
+    digest = hashlib.sha1(np.ascontiguousarray(window, dtype=np.float64).tobytes())
+    digest.update(f'{float(data_min)!r}:{float(data_max)!r}:{pd.Timestamp(last_date).date()}'.encode('utf-8'))
+    return digest.hexdigest()[:20]
+
+
+def forecast_key(metric, customer_id, digest, model_version, horizon, mode='recursive'):
+    return f'forecast:{metric}:{customer_id}:{digest}:{model_version}:{horizon}:{mode}'
+
+
+def memoized_forecasts(metric, model_version, customer_ids, windows, data_min, data_max, last_date, horizon, compute,
+                       mode='recursive'):
+    """
+    Forecasts of many series through the forecasts cache (CACHES['forecasts']), one entry per customer.
+    compute(windows, data_min, data_max) only runs for the customers missing from the cache. The key holds
+    the model version and a digest of the input tail, so a retrained model or new data for a customer
+    make its entry unreachable without any explicit invalidation.
+    """
+
+    windows = np.asarray(windows, dtype=np.float64)
+    data_min = np.asarray(data_min, dtype=np.float64)
+    data_max = np.asarray(data_max, dtype=np.float64)
+
+    keys = [forecast_key(metric, customer_id, window_digest(window, low, high, last_date), model_version, horizon, mode)
+            for customer_id, window, low, high in zip(customer_ids, windows, data_min, data_max)]
+
+    cache = caches['forecasts']
+    hits = cache.get_many(keys)
+    predictions = np.empty((len(keys), horizon + 1))
+    missing = []
+    for i, key in enumerate(keys):
+        if key in hits:
+            predictions[i] = hits[key]
+        else:
+            missing.append(i)
+
+    if missing:
+        computed = compute(windows[missing], data_min[missing], data_max[missing])
+        predictions[missing] = computed
+        cache.set_many({keys[i]: computed[j] for j, i in enumerate(missing)})
+
+    logger.info(f"Forecasts of {metric}: {len(keys) - len(missing)} cached, {len(missing)} computed.")
+    return predictions
@@ -0,0 +1,205 @@
+import io
+import logging
+
+import pandas as pd
+
+from core.utils import get_config
+from exploration.constants import (DIR_NAME, FILENAME, COL_ORDERS, COL_EARNINGS,
+                                   MAX_CUSTOMER_IDS, MAX_FORECAST_HORIZON, SERIES_OPERATIONS)
+from exploration.registry import registry
+from exploration.precompute import forecast_values, fresh_forecasts, series_digests
+from exploration.utils import load_customer_series, predict_customers, preprocess_all_data
+
+
+logger = logging.getLogger(__name__)
+
+# Output formats of the forecast endpoints and their content types
+FORECAST_FORMATS = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value).normalize()
+    except ValueError:
+        raise ValueError(f"Invalid {name} date {value}, expected YYYY-MM-DD")
+
+
+def forecast_parameters(params):
+    """
+    Validate the query parameters of a forecast request: horizon, start, end, history and output.
+    Without an explicit horizon, an end date after the last known day sets the horizon, NUM_PREDICTION otherwise.
+    """
+
+    fmt = params.get('output', 'json')
+    if fmt not in FORECAST_FORMATS:
+        raise ValueError(f"Unknown output {fmt}, expected {', '.join(FORECAST_FORMATS)}")
+
+    start, end = parse_date(params.get('start'), 'start'), parse_date(params.get('end'), 'end')
+    if start is not None and end is not None and start > end:
+        raise ValueError(f"start {start.date()} is after end {end.date()}")
+
+    horizon = params.get('horizon')
+    if horizon is not None:
+        try:
+            horizon = int(horizon)
+        except ValueError:
+            raise ValueError(f"Invalid horizon {horizon}, expected an integer")
+        if not 1 <= horizon <= MAX_FORECAST_HORIZON:
+            raise ValueError(f"horizon must be between 1 and {MAX_FORECAST_HORIZON}")
+
+    return {
+        'fmt': fmt,
+        'horizon': horizon,
+        'start': start,
+        'end': end,
+        'history': params.get('history', '0').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def forecast_frame(col, horizon=None, start=None, end=None, history=False):
+    """
+    Future predictions of the daily total of col for all the customers, as a frame of created_at, value
+    and predicted. The first predicted row is the last known day, as in predict_new_values.
+    With history the known days come first, rows are limited to the [start, end] date range.
+    """
+
+    df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+    last_date = pd.Timestamp(df_lstm['created_at'].values[-1])
+
+    if horizon is None:
+        horizon = get_config('NUM_PREDICTION', cast=int)
+        if end is not None and end > last_date:
+            horizon = min((end - last_date).days, MAX_FORECAST_HORIZON)
+
+    prediction_dates, prediction_list = forecast_values(FILENAME, col, lambda: df_lstm, horizon)
+    if col == COL_ORDERS:
+        prediction_list = [int(i) for i in prediction_list]
+
+    frames = [pd.DataFrame({'created_at': pd.to_datetime(prediction_dates), 'value': prediction_list, 'predicted': True})]
+    if history:
+        frames.insert(0, pd.DataFrame({'created_at': pd.to_datetime(df_lstm['created_at']), 'value': df_lstm[col], 'predicted': False}))
+    frame = pd.concat(frames, ignore_index=True)
+
+    if start is not None:
+        frame = frame[frame['created_at'] >= start]
+    if end is not None:
+        frame = frame[frame['created_at'] <= end]
+    return frame.reset_index(drop=True)
+
+
+def forecast_json(col, frame):
+    """
+    Compact json body of a forecast: prediction_dates and prediction_list, plus history when requested.
+    """
+
+    predicted = frame[frame['predicted']]
+    body = {
+        'metric': col,
+        'model_version': registry.version(col),
+        'prediction_dates': predicted['created_at'].dt.strftime('%Y-%m-%d').tolist(),
+        'prediction_list': predicted['value'].tolist(),
+    }
+    known = frame[~frame['predicted']]
+    if len(known):
+        body['history'] = {'dates': known['created_at'].dt.strftime('%Y-%m-%d').tolist(),
+                           'values': known['value'].tolist()}
+    return body
+
+
+def forecast_bytes(frame, fmt):
+    """
+    Serialize a forecast frame to csv or to an Arrow IPC stream.
+    """
+
+    if fmt == 'csv':
+        return frame.to_csv(index=False, date_format='%Y-%m-%d').encode('utf-8')
+
+    import pyarrow as pa
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def parse_customer_ids(values):
+    """
+    Customer ids of a lookup, given one by one or comma separated, in request order without duplicates.
+    """
+
+    customer_ids = []
+    for value in values:
+        for customer_id in str(value).split(','):
+            customer_id = customer_id.strip()
+            if not customer_id:
+                continue
+            if not customer_id.isdigit():
+                raise ValueError(f"Invalid customer_id {customer_id}, expected an integer")
+            customer_ids.append(str(int(customer_id)))
+
+    customer_ids = list(dict.fromkeys(customer_ids))
+    if not customer_ids:
+        raise ValueError("No customer_id given")
+    if len(customer_ids) > MAX_CUSTOMER_IDS:
+        raise ValueError(f"At most {MAX_CUSTOMER_IDS} customer ids per request, got {len(customer_ids)}")
+    return customer_ids
+
+
+def metric_forecasts(col, customer_ids):
+    """
+    Forecasts of col for the given customers only: the fresh precomputed ones from the Forecast table,
+    the others computed in one batch from the series store of the worker. Customers unknown to FILENAME are left out.
+    Returns the prediction dates and a dict customer_id -> list of values.
+    """
+
+    store = load_customer_series(DIR_NAME, FILENAME, col, SERIES_OPERATIONS[col])
+    known = [i for i in customer_ids if i in store]
+    if not known:
+        return None, {}
+
+    prediction_dates, forecasts = None, {}
+    for customer_id, (first_date, values) in fresh_forecasts(FILENAME, col, series_digests(col, store, known)).items():
+        forecasts[customer_id] = values
+        prediction_dates = pd.date_range(first_date, periods=len(values)).tolist()
+
+    missing = [i for i in known if i not in forecasts]
+    if missing:
+        prediction_dates, predictions = predict_customers(col, store, [int(i) for i in missing])
+        forecasts.update(zip(missing, predictions.tolist()))
+    return prediction_dates, forecasts
+
+
+def customer_forecasts(customer_ids):
+    """
+    Json body of a per customer lookup: the predicted orders and values of each requested customer with their totals,
+    as data_predict_per_customer sums them, and the ids that are not returning customers of FILENAME.
+    """
+
+    orders_dates, orders = metric_forecasts(COL_ORDERS, customer_ids)
+    values_dates, values = metric_forecasts(COL_EARNINGS, customer_ids)
+
+    customers = []
+    for customer_id in customer_ids:
+        if customer_id not in orders and customer_id not in values:
+            continue
+        predicted_orders = [int(i) for i in orders[customer_id]] if customer_id in orders else None
+        customers.append({
+            'customer_id': customer_id,
+            'predicted_orders': predicted_orders,
+            'total_predicted_orders': sum(predicted_orders) if predicted_orders is not None else None,
+            'predicted_values': values.get(customer_id),
+            'total_predicted_values': sum(values[customer_id]) if customer_id in values else None,
+        })
+
+    return {
+        'prediction_dates': {COL_ORDERS: [str(i.date()) for i in orders_dates or []],
+                             COL_EARNINGS: [str(i.date()) for i in values_dates or []]},
+        'customers': customers,
+        'unknown_customer_ids': [i for i in customer_ids if i not in orders and i not in values],
+    }
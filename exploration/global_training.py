@@ -0,0 +1,117 @@
+import time
+import logging
+import resource
+
+import numpy as np
+import tensorflow as tf
+from sklearn.preprocessing import MinMaxScaler
+
+from core.utils import get_config
+from exploration.constants import DIR_NAME, FILENAME, SERIES_OPERATIONS
+from exploration.metrics import stage
+from exploration.utils import (build_model, load_customer_series, minmax_scaling, preprocess_all_data, save_model,
+                               sliding_windows)
+
+
+logger = logging.getLogger(__name__)
+
+
+def training_rows(store, min_days=2):
+    """
+    Rows of the store used for the global model: customers with orders on at least min_days days,
+    single order customers only contribute windows of zeros.
+    """
+
+    return np.flatnonzero(np.diff(store.indptr) >= min_days)
+
+
+def customer_windows(store, rows, lookback, prediction_horizon, batch_size, block_customers, seed=0):
+    """
+    Generator of shuffled (X, Y) training batches over the series of the given rows of a CustomerSeriesStore.
+    Each series is scaled to (0, 1) on its own min/max, as the forecasts do. Customers are visited in a new random
+    order on every call and densified block_customers at a time, the windows of a block are shuffled together,
+    so memory is bounded by one block whatever the number of customers.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    def generate():
+        order = rng.permutation(rows)
+        for begin in range(0, len(order), block_customers):
+            block = order[begin : begin + block_customers]
+            scale, offset = minmax_scaling(store.mins[block], store.maxs[block])
+            series = store.dense(block) * scale[:, None] + offset[:, None]
+
+            X, Y = sliding_windows(series[:, :, None], lookback, prediction_horizon)
+            X = X.reshape((-1, lookback, 1)).astype(np.float32)
+            Y = Y.reshape((-1, prediction_horizon)).astype(np.float32)
+            shuffle = rng.permutation(len(X))
+            for batch in range(0, len(X), batch_size):
+                yield X[shuffle[batch : batch + batch_size]], Y[shuffle[batch : batch + batch_size]]
+
+    return generate
+
+
+def window_dataset(generate, lookback, prediction_horizon):
+    """
+    tf.data pipeline over a batch generator, prefetching the next batches while the model trains.
+    """
+
+    return tf.data.Dataset.from_generator(
+        generate,
+        output_signature=(tf.TensorSpec(shape=(None, lookback, 1), dtype=tf.float32),
+                          tf.TensorSpec(shape=(None, prediction_horizon), dtype=tf.float32)),
+    ).prefetch(tf.data.AUTOTUNE)
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def prepare_global_model(col, neurons, epochs, batch_size, lookback=1, prediction_horizon=1, callbacks=None,
+                         dir_name=DIR_NAME, filename=FILENAME):
+    """
+    Train one LSTM model on the windows of every repeat customer's series of col, streamed in shuffled batches,
+    and save it where predict_new_values reads it from. The model is then tested like prepare_model,
+    on the last 30% of the aggregated daily series, so that both training modes report comparable MAPE.
+    Returns Y_test, test_predict and the training stats (windows, windows/s, peak memory).
+    """
+
+    store = load_customer_series(dir_name, filename, col, SERIES_OPERATIONS[col])
+    rows = training_rows(store, get_config('GLOBAL_MIN_DAYS', 2, cast=int))
+    windows_per_series = max(store.n_days - lookback - prediction_horizon + 1, 0)
+    if not len(rows) or not windows_per_series:
+        raise ValueError(f"No training windows for {col}: {len(rows)} customers over {store.n_days} days")
+
+    generate = customer_windows(store, rows, lookback, prediction_horizon, batch_size,
+                                get_config('GLOBAL_BLOCK_CUSTOMERS', 512, cast=int))
+    model = build_model(neurons, lookback, prediction_horizon)
+
+    logger.info(f"Global training of {col} on {len(rows)} customers, {len(rows) * windows_per_series} windows per epoch.")
+    start = time.perf_counter()
+    with stage('model_fit', rows=len(rows) * windows_per_series * epochs):
+        model.fit(window_dataset(generate, lookback, prediction_horizon), epochs=epochs, verbose=0, callbacks=callbacks)
+    fit_time = time.perf_counter() - start
+
+    save_model(model, col)
+
+    # Test on the aggregated series, as prepare_model does
+    data = preprocess_all_data(dir_name, filename)[col].values.reshape((-1, 1))
+    scaler = MinMaxScaler(feature_range=(0,1))
+    data = scaler.fit_transform(data)
+    X_test, Y_test = sliding_windows(data[int(len(data) * 0.7):], lookback, prediction_horizon,
+                                     legacy=get_config('LSTM_WINDOWS', 'all') == 'legacy')
+    with stage('model_predict', rows=len(X_test)):
+        test_predict = scaler.inverse_transform(model.predict(X_test, verbose=0))
+    Y_test = scaler.inverse_transform(Y_test)
+
+    stats = {
+        'customers': int(len(rows)),
+        'windows': int(len(rows) * windows_per_series * epochs),
+        'fit_seconds': round(fit_time, 2),
+        'windows_per_second': round(len(rows) * windows_per_series * epochs / fit_time, 1),
+        'peak_memory_mb': round(peak_memory_mb(), 1),
+    }
+    logger.info(f"Global LSTM model for {col} trained: {stats}")
+    return Y_test, test_predict, stats
@@ -0,0 +1,262 @@
+import io
+import os
+import json
+import fcntl
+import logging
+from collections import defaultdict
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+
+from core.utils import get_config
+from exploration.cache import (artifact_paths, artifact_locks, cached_frame, chain_digest, read_metadata, read_partitions,
+                               refresh_artifact, replace_artifact, source_path, stat_fingerprint, update_partitions)
+from exploration.constants import FILENAME, FILENAME_ORDERS, FILENAME_ORDER_VALUES, COL_ORDERS, SERIES_OPERATIONS
+from exploration.series_store import add_long_frames, long_customer_frame
+from exploration.utils import (RowHashes, csv_header, customer_series_artifact, daily_frame, fold_daily_chunk,
+                               load_customer_series, order_dtypes, preprocess_all_data, scan_daily_data, series_artifact)
+
+
+logger = logging.getLogger(__name__)
+
+# Per customer series kept up to date by the ingestion, as (col, operation_type)
+INGEST_SERIES = list(SERIES_OPERATIONS.items())
+
+# Input files holding the orders of a selection of customers, read by the per customer forecasts:
+# the orders of their customers ingested into FILENAME are appended to them too
+CUSTOMER_FILES = [FILENAME_ORDERS, FILENAME_ORDER_VALUES]
+
+
+class IngestConflict(RuntimeError):
+    """
+    An input file changed while an ingestion was being prepared, the batch was not appended.
+    """
+
+
+def read_batch(data, fmt='csv'):
+    """
+    Parse a batch of order rows given as csv text with a header, or as newline delimited json.
+    Values are kept as text, so that they are appended to the input csv as they were received.
+    """
+
+    if fmt == 'csv':
+        return pd.read_csv(io.StringIO(data), dtype=str, keep_default_na=False)
+    if fmt == 'ndjson':
+        rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+        df = pd.DataFrame(rows, dtype=object)
+        return df.where(df.notna(), '').astype(str)
+    raise ValueError(f"Unknown batch format {fmt}, expected csv or ndjson")
+
+
+def hash_frame(seen, days):
+    """
+    Row hashes of the given days as a long frame, the rows of the full_row_hashes artifact.
+    """
+
+    arrays = [seen[day].array() for day in days]
+    return pd.DataFrame({'created_at': np.repeat(np.array(days, dtype=object), [len(i) for i in arrays]),
+                         'hash': np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64)})
+
+
+def daily_state(dir_name, filename):
+    """
+    Per day row hashes and summation compensations of the returning visitors of an input csv, cached on disk,
+    so that an ingested batch is deduplicated and summed exactly as a full preprocessing of the file would.
+    The row hashes are partitioned by day and only made current here, an ingestion reads the days of its batch.
+    Returns the compensations.
+    """
+
+    path = source_path(dir_name, filename)
+    scanned = {}
+
+    def scan(name):
+        if not scanned:
+            seen, orders, earnings = scan_daily_data(dir_name, filename, get_config('PREPROCESS_CHUNKSIZE', 0, cast=int) or 500000)
+            days = sorted(earnings)
+            scanned['full_row_hashes'] = hash_frame(seen, days)
+            scanned['daily_compensation'] = pd.DataFrame({'created_at': days,
+                                                          'compensation': [earnings[day][1] for day in days]})
+        return scanned[name]
+
+    refresh_artifact(path, 'full_row_hashes', lambda: scan('full_row_hashes'), partition='created_at')
+    return cached_frame(path, 'daily_compensation', lambda: scan('daily_compensation'))
+
+
+def append_rows(path, batch, header):
+    """
+    Append the batch to the csv at path, in the column order of its header. Returns the appended text.
+    """
+
+    text = batch[header].to_csv(header=False, index=False)
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                text = '\n' + text
+        f.write(text.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+    return text
+
+
+def ingest_target(dir_name, filename, batch, project=False):
+    """
+    Check a batch against the header of an input csv, returns (filename, header, rows). With project, the batch
+    may hold more columns than the file and only those of the file are kept, otherwise both must match.
+    """
+
+    header = csv_header(source_path(dir_name, filename))
+    missing = [i for i in header if i not in batch.columns]
+    unknown = [] if project else [i for i in batch.columns if i not in header]
+    if missing or unknown:
+        raise ValueError(f"Batch columns do not match {filename}: missing {missing}, unknown {unknown}")
+    return filename, header, batch[header]
+
+
+def update_artifacts(path, header, text, meta, daily):
+    """
+    Update the artifacts of an input csv after text was appended to it: the per customer series and, for a full export
+    (daily holds its daily aggregate and compensations), the daily aggregate, compensations and row hashes. Only the days of the batch
+    are read and rewritten in the partitioned artifacts. Returns a summary of the batch.
+    """
+
+    new_rows = ','.join(header) + '\n' + text
+    parsed = pd.read_csv(io.StringIO(new_rows))
+    summary = {'rows': len(parsed), 'duplicates': 0, 'days': [], 'customers': int(parsed['customer_id'].nunique()), 'new_days': 0}
+    folded = parsed.index
+
+    if daily is not None:
+        # Daily aggregates, the sums of the days of the batch continue from their state
+        chunk = pd.read_csv(io.StringIO(new_rows), dtype=order_dtypes(header))
+        seen = defaultdict(RowHashes)
+        stored = read_partitions(path, 'full_row_hashes', pd.to_datetime(chunk['created_at']).dt.date.dropna())
+        if stored is not None:
+            for day, hashes in stored.groupby('created_at')['hash']:
+                seen[pd.Timestamp(day).date()] = RowHashes(hashes.to_numpy(dtype=np.uint64))
+
+        df_lstm, compensations = daily
+        compensation = dict(zip(compensations['created_at'], compensations['compensation']))
+        earnings = {day: (total, compensation.get(day, 0.0))
+                    for day, total in zip(df_lstm['created_at'], df_lstm['total_order_value'])}
+        orders = defaultdict(int)
+        summary['duplicates'], folded = fold_daily_chunk(chunk, seen, orders, earnings)
+
+        totals = dict(zip(df_lstm['created_at'], df_lstm['order_id']))
+        for day in sorted(orders):
+            summary['new_days'] += day not in totals
+            totals[day] = totals.get(day, 0) + orders[day]
+        summary['days'] = [str(day) for day in sorted(orders)]
+
+        days = sorted(earnings)
+        replace_artifact(path, 'daily', daily_frame(totals, {day: total for day, (total, _) in earnings.items()}), meta)
+        replace_artifact(path, 'daily_compensation',
+                         pd.DataFrame({'created_at': days, 'compensation': [earnings[day][1] for day in days]}), meta)
+        update_partitions(path, 'full_row_hashes', hash_frame(seen, sorted(seen)), 'created_at', meta)
+
+    # Per customer series, only the customer days of the new rows (of returning visitors for a full export) are added
+    for col, operation_type in INGEST_SERIES:
+        name = series_artifact(col, operation_type)
+        delta = long_customer_frame(parsed.loc[folded], col, operation_type)
+        current = read_partitions(path, name, delta['created_at'])
+        update_partitions(path, name, delta if current is None else add_long_frames(current, delta), 'created_at', meta)
+
+    return summary
+
+
+def ingest_files(dir_name, targets):
+    """
+    Append batches to several input csvs as one ingestion, targets holding (filename, header, rows) as ingest_target
+    returns them. Every file is locked and its artifacts brought up to date before anything is appended, and the rows
+    already appended are truncated again if an append fails, so that the batch lands in all the files or in none.
+    The artifacts are then updated in place without reading the rest of the files: the first ingestion of a file
+    costs one full preprocessing. Returns a summary per file.
+    """
+
+    summaries = {}
+    with ExitStack() as stack:
+        paths = {filename: source_path(dir_name, filename) for filename, _, _ in targets}
+        for filename in sorted(paths):
+            # One ingestion at a time per file
+            ingest_lock = stack.enter_context(open(artifact_paths(paths[filename], 'ingest')[2], 'w'))
+            fcntl.flock(ingest_lock, fcntl.LOCK_EX)
+
+        states = {}
+        for filename, header, rows in targets:
+            names = [series_artifact(col, operation_type) for col, operation_type in INGEST_SERIES]
+            for col, operation_type in INGEST_SERIES:
+                refresh_artifact(*customer_series_artifact(dir_name, filename, col, operation_type), partition='created_at')
+            daily = None
+            if 'visitor_type' in header:
+                # A full export, the daily aggregates of its returning visitors are kept too
+                daily = preprocess_all_data(dir_name, filename), daily_state(dir_name, filename)
+                names += ['daily', 'full_row_hashes', 'daily_compensation']
+            states[filename] = (names, daily)
+
+        offsets = {}
+        for filename in sorted(paths):
+            stack.enter_context(artifact_locks(paths[filename], states[filename][0]))
+            offset = os.path.getsize(paths[filename])
+            metas = [read_metadata(artifact_paths(paths[filename], name)[1]) for name in states[filename][0]]
+            if any(meta is None or meta['size'] != offset for meta in metas):
+                raise IngestConflict(f"{filename} changed while preparing the ingestion, try again")
+            offsets[filename] = (offset, metas[0])
+
+        texts = {}
+        try:
+            for filename, header, rows in targets:
+                texts[filename] = None
+                texts[filename] = append_rows(paths[filename], rows, header)
+        except Exception:
+            for filename in texts:
+                os.truncate(paths[filename], offsets[filename][0])
+            raise
+
+        for filename, header, rows in targets:
+            offset, meta = offsets[filename]
+            meta = dict(stat_fingerprint(paths[filename]), sha256=chain_digest(meta['sha256'], paths[filename], offset),
+                        segments=meta.get('segments', []) + [offset])
+            summaries[filename] = update_artifacts(paths[filename], header, texts[filename], meta, states[filename][1])
+            logger.info(f"Ingested {len(rows)} rows into {filename}: {len(summaries[filename]['days'])} days "
+                        f"({summaries[filename]['new_days']} new), {summaries[filename]['customers']} customers, "
+                        f"{summaries[filename]['duplicates']} duplicates.")
+
+    return summaries
+
+
+def ingest_orders(dir_name, filename, batch):
+    """
+    Append a batch of order rows to an input csv and update its cached artifacts in place, see ingest_files.
+    Returns a summary of the batch.
+    """
+
+    target = ingest_target(dir_name, filename, batch)
+    if batch.empty:
+        return {'rows': 0, 'duplicates': 0, 'days': [], 'customers': 0, 'new_days': 0}
+    return ingest_files(dir_name, [target])[filename]
+
+
+def ingest_batch(dir_name, batch, filename=FILENAME):
+    """
+    Ingest a batch into an input csv as ingest_orders does. The orders of a batch of FILENAME are also appended to
+    the CUSTOMER_FILES, restricted to the customers each of them holds and to its columns, in the same ingestion,
+    so that the per customer series and forecasts of the legacy endpoint see them.
+    Returns the summary of filename, with the number of rows ingested into each customer file under 'files'.
+    """
+
+    targets = [ingest_target(dir_name, filename, batch)]
+    if batch.empty:
+        return {'rows': 0, 'duplicates': 0, 'days': [], 'customers': 0, 'new_days': 0, 'files': {}}
+
+    if filename == FILENAME:
+        customer_ids = pd.to_numeric(batch['customer_id'], errors='coerce')
+        for name in CUSTOMER_FILES:
+            if not os.path.exists(source_path(dir_name, name)):
+                continue
+            selected = customer_ids.isin(load_customer_series(dir_name, name, COL_ORDERS, SERIES_OPERATIONS[COL_ORDERS]).customer_ids)
+            if selected.any():
+                targets.append(ingest_target(dir_name, name, batch[selected.to_numpy()], project=True))
+
+    summaries = ingest_files(dir_name, targets)
+    return dict(summaries[filename], files={name: summary['rows'] for name, summary in summaries.items() if name != filename})
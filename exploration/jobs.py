@@ -0,0 +1,227 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.db import connections
+from django.utils import timezone
+
+from core.utils import get_config
+from exploration.constants import DIR_NAME, FILENAME, COL_ORDERS, COL_EARNINGS, LOOKBACK, PREDICTION_HORIZON
+from exploration.models import TrainingJob
+from exploration.workers import init_worker
+
+
+logger = logging.getLogger(__name__)
+
+# Suffix of the .env training parameters of each column, e.g. NEURONS_GEN_ORDERS
+TRAINING_CONFIG = {
+    COL_ORDERS: 'ORDERS',
+    COL_EARNINGS: 'EARNINGS',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Owner of the jobs queued by this process, the token tells it apart from an earlier process with the same pid
+OWNER = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def training_parameters(col, mode=TrainingJob.AGGREGATE):
+    """
+    Neurons, epochs and batch size of the generalized model of a column, read from .env.
+    The global mode trains on far more windows, with its own epochs and (large) batch size.
+    """
+
+    suffix = TRAINING_CONFIG[col]
+    if mode == TrainingJob.GLOBAL:
+        return {
+            'neurons': get_config(f'NEURONS_GEN_{suffix}', cast=int),
+            'epochs': get_config('GLOBAL_EPOCHS', 5, cast=int),
+            'batch_size': get_config('GLOBAL_BATCH_SIZE', 1024, cast=int),
+        }
+    return {
+        'neurons': get_config(f'NEURONS_GEN_{suffix}', cast=int),
+        'epochs': get_config(f'EPOCHS_GEN_{suffix}', cast=int),
+        'batch_size': get_config(f'BATCH_SIZE_GEN_{suffix}', cast=int),
+    }
+
+
+def executor():
+    """
+    Process pool running the training jobs, TRAINING_WORKERS processes configurable in .env.
+    Workers are spawned rather than forked, tensorflow state of the web process is not fork safe.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            recover_jobs()
+            _executor = ProcessPoolExecutor(max_workers=get_config('TRAINING_WORKERS', 1, cast=int),
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=init_worker)
+    return _executor
+
+
+def reset_executor():
+    """
+    Drop a broken pool, the next job starts a new one.
+    """
+
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def owner_alive(owner):
+    """
+    Whether the web process owning a job may still run it: this process, or another live process of this host.
+    Processes of other hosts are assumed alive, jobs queued before owners were recorded are not.
+    """
+
+    if owner == OWNER:
+        return True
+    if not owner:
+        return False
+    host, pid = (owner.split(':') + [''])[:2]
+    if host != socket.gethostname():
+        return True
+    if not pid.isdigit() or int(pid) == os.getpid():
+        # Same pid as this process but another token, a process that ran before it
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover_jobs():
+    """
+    Fail the queued and running jobs whose web process is gone, e.g. after a restart: their pool died with it.
+    Returns the number of jobs failed.
+    """
+
+    active = [TrainingJob.QUEUED, TrainingJob.RUNNING]
+    stale = [job.pk for job in TrainingJob.objects.filter(status__in=active).only('pk', 'owner') if not owner_alive(job.owner)]
+    if stale:
+        TrainingJob.objects.filter(pk__in=stale, status__in=active).update(
+            status=TrainingJob.FAILED, error='Interrupted by a restart of the web process', finished_at=timezone.now())
+        logger.warning(f"Training jobs {stale} interrupted by a restart, marked as failed.")
+    return len(stale)
+
+
+def fail_job(job_id, error):
+    TrainingJob.objects.filter(pk=job_id, status__in=[TrainingJob.QUEUED, TrainingJob.RUNNING]).update(
+        status=TrainingJob.FAILED, error=error, finished_at=timezone.now())
+
+
+def job_done(job_id, future):
+    """
+    run_training_job records its own failures, an exception here means that the job never ran to the end:
+    its worker process died or the job could not be sent to it.
+    """
+
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Training job {job_id} lost: {error!r}")
+        fail_job(job_id, f'Training worker failed: {error!r}')
+        if isinstance(error, BrokenProcessPool):
+            reset_executor()
+
+
+def progress_callback(job_id, interval=1.0):
+    """
+    Keras callback recording the current epoch and loss of a job, at most once per interval seconds.
+    """
+
+    from tensorflow.keras.callbacks import Callback
+
+    class JobProgress(Callback):
+        last_update = 0.0
+
+        def on_epoch_end(self, epoch, logs=None):
+            now = time.monotonic()
+            if now - self.last_update >= interval or epoch + 1 == self.params.get('epochs'):
+                self.last_update = now
+                TrainingJob.objects.filter(pk=job_id).update(epoch=epoch + 1, loss=(logs or {}).get('loss'))
+
+    return JobProgress()
+
+
+def run_training_job(job_id):
+    """
+    Train the generalized model of a job inside a worker process and record the result.
+    """
+
+    from sklearn.metrics import mean_absolute_percentage_error
+    from exploration.utils import preprocess_all_data, prepare_model
+    from exploration.global_training import prepare_global_model
+
+    connections.close_all()
+    job = TrainingJob.objects.get(pk=job_id)
+    TrainingJob.objects.filter(pk=job_id).update(status=TrainingJob.RUNNING, started_at=timezone.now())
+
+    try:
+        parameters = training_parameters(job.col, job.mode)
+        stats = {}
+        if job.mode == TrainingJob.GLOBAL:
+            Y_test, test_predict, stats = prepare_global_model(job.col,
+                                                               parameters['neurons'],
+                                                               parameters['epochs'],
+                                                               parameters['batch_size'],
+                                                               lookback=LOOKBACK,
+                                                               prediction_horizon=PREDICTION_HORIZON,
+                                                               callbacks=[progress_callback(job_id)])
+        else:
+            df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+            Y_test, test_predict = prepare_model(df_lstm, job.col,
+                                                 parameters['neurons'],
+                                                 parameters['epochs'],
+                                                 parameters['batch_size'],
+                                                 lookback=LOOKBACK,
+                                                 prediction_horizon=PREDICTION_HORIZON,
+                                                 callbacks=[progress_callback(job_id)])
+    except Exception as e:
+        logger.exception(f"Training job {job_id} for {job.col} failed.")
+        TrainingJob.objects.filter(pk=job_id).update(status=TrainingJob.FAILED, error=str(e), finished_at=timezone.now())
+        return
+
+    mape = float(mean_absolute_percentage_error(Y_test, test_predict))
+    TrainingJob.objects.filter(pk=job_id).update(status=TrainingJob.SUCCEEDED,
+                                                 mape=mape,
+                                                 stats=stats,
+                                                 artifact=os.path.join(os.getcwd(), 'model_' + job.col + '.h5'),
+                                                 actual=[float(i) for i in Y_test[:][0]],
+                                                 predicted=[float(i) for i in test_predict[:][0]],
+                                                 finished_at=timezone.now())
+    logger.info(f"Training job {job_id} for {job.col} finished, MAPE {mape}.")
+
+
+def submit_training(col, mode=TrainingJob.AGGREGATE):
+    """
+    Queue the training of the generalized model of a column and return its TrainingJob,
+    failed with the error when it could not be queued.
+    """
+
+    job = TrainingJob.objects.create(col=col, mode=mode, epochs=training_parameters(col, mode)['epochs'], owner=OWNER)
+    try:
+        future = executor().submit(run_training_job, job.pk)
+    except Exception as e:
+        logger.exception(f"Training job {job.pk} for {col} could not be queued.")
+        fail_job(job.pk, f'Could not queue the training: {e!r}')
+        if isinstance(e, BrokenProcessPool):
+            reset_executor()
+        job.refresh_from_db()
+        return job
+
+    future.add_done_callback(lambda future: job_done(job.pk, future))
+    logger.info(f"Training job {job.pk} for {col} ({mode}) queued.")
+    return job
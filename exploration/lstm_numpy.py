@@ -0,0 +1,116 @@
+import json
+import logging
+
+import h5py
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def sigmoid(x):
+    # tanh form, does not overflow for large negative inputs
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+def relu(x):
+    return np.maximum(x, 0.0)
+
+
+def linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    'sigmoid': sigmoid,
+    'hard_sigmoid': hard_sigmoid,
+    'relu': relu,
+    'tanh': np.tanh,
+    'linear': linear,
+}
+
+
+def layer_weights(group):
+    """
+    Weights of a layer group of a keras h5 file by short name (kernel, recurrent_kernel, bias),
+    whatever the nesting of the keras version that saved it (e.g. lstm/lstm/lstm_cell/kernel:0).
+    """
+
+    weights = {}
+
+    def collect(name, obj):
+        if isinstance(obj, h5py.Dataset):
+            weights[name.split('/')[-1].split(':')[0]] = obj[()]
+
+    group.visititems(collect)
+    return weights
+
+
+class NumpyLSTMModel:
+    """
+    Inference only implementation of the models built in prepare_model: one LSTM layer followed by a Dense head.
+    Called like a keras model, model(x) maps an (N, LOOKBACK, 1) batch to an (N, prediction_horizon) array,
+    without importing tensorflow.
+    """
+
+    def __init__(self, kernel, recurrent_kernel, bias, dense_kernel, dense_bias,
+                 activation='relu', recurrent_activation='sigmoid', dense_activation='linear'):
+        self.kernel = kernel
+        self.recurrent_kernel = recurrent_kernel
+        self.bias = bias
+        self.dense_kernel = dense_kernel
+        self.dense_bias = dense_bias
+        self.units = recurrent_kernel.shape[0]
+        self.activation = ACTIVATIONS[activation]
+        self.recurrent_activation = ACTIVATIONS[recurrent_activation]
+        self.dense_activation = ACTIVATIONS[dense_activation]
+
+    @classmethod
+    def from_h5(cls, path):
+        """
+        Read the LSTM and Dense weights and activations of a model saved with model.save('model_<col>.h5').
+        """
+
+        with h5py.File(path, 'r') as f:
+            model_config = f.attrs['model_config']
+            if isinstance(model_config, bytes):
+                model_config = model_config.decode('utf-8')
+            layers = json.loads(model_config)['config']['layers']
+            lstm = next(layer['config'] for layer in layers if layer['class_name'] == 'LSTM')
+            dense = next(layer['config'] for layer in layers if layer['class_name'] == 'Dense')
+
+            lstm_weights = layer_weights(f['model_weights'][lstm['name']])
+            dense_weights = layer_weights(f['model_weights'][dense['name']])
+
+        logger.info(f"Numpy LSTM model loaded from {path}.")
+
+        return cls(lstm_weights['kernel'], lstm_weights['recurrent_kernel'], lstm_weights['bias'],
+                   dense_weights['kernel'], dense_weights['bias'],
+                   activation=lstm['activation'],
+                   recurrent_activation=lstm['recurrent_activation'],
+                   dense_activation=dense['activation'])
+
+    def __call__(self, x, training=False):
+        x = np.asarray(x, dtype=self.kernel.dtype)
+        units = self.units
+        h = np.zeros((x.shape[0], units), dtype=self.kernel.dtype)
+        c = np.zeros((x.shape[0], units), dtype=self.kernel.dtype)
+
+        # Gates in keras order: input, forget, cell candidate, output
+        for step in range(x.shape[1]):
+            z = x[:, step, :] @ self.kernel + h @ self.recurrent_kernel + self.bias
+            i = self.recurrent_activation(z[:, :units])
+            f = self.recurrent_activation(z[:, units:2 * units])
+            g = self.activation(z[:, 2 * units:3 * units])
+            o = self.recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * self.activation(c)
+
+        return self.dense_activation(h @ self.dense_kernel + self.dense_bias)
+
+    def predict(self, x, **kwargs):
+        return self(x)
@@ -0,0 +1,45 @@
+import json
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from exploration.benchmarks import run_benchmarks, compare_reports
+
+
+class Command(BaseCommand):
+    help = ('Time and measure the peak memory of the preprocessing, training and forecasting hot paths on synthetic orders, '
+            'write the results as json and optionally fail when they regress against a baseline report.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--customers', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--epochs', type=int, default=2, help='Epochs of the timed training, reported per epoch')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed calls per benchmark, the best one is reported')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmarks.json')
+        parser.add_argument('--baseline', help='Report of a previous run to compare with')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Fail when a benchmark is this many times slower than in the baseline')
+
+    def handle(self, *args, **options):
+        report = run_benchmarks(options['rows'], options['customers'], options['days'],
+                                epochs=options['epochs'], repeat=options['repeat'], seed=options['seed'])
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.stdout.write(pd.DataFrame(report['results']).T.to_string())
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if baseline.get('parameters') != report['parameters']:
+                self.stdout.write(self.style.WARNING(f"Baseline parameters differ: {baseline.get('parameters')}"))
+
+            comparison = compare_reports(report, baseline, options['threshold'])
+            self.stdout.write(pd.DataFrame(comparison).to_string(index=False))
+            regressions = [row['benchmark'] for row in comparison if row['regression']]
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmarks regressed beyond {options['threshold']}x: {', '.join(regressions)}")
+            self.stdout.write(self.style.SUCCESS(f"No regression beyond {options['threshold']}x the baseline"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from exploration.benchmarks import benchmark_per_customer
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized per customer preprocessing with the legacy per customer loop on synthetic orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--customers', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--no-legacy', action='store_true', help='Only time the vectorized implementation')
+
+    def handle(self, *args, **options):
+        results = benchmark_per_customer(options['rows'], options['customers'], options['days'],
+                                         legacy=not options['no_legacy'])
+
+        self.stdout.write(f"vectorized: {results['vectorized_s']:.3f}s")
+        if 'legacy_s' in results:
+            self.stdout.write(f"legacy:     {results['legacy_s']:.3f}s")
+            self.stdout.write(self.style.SUCCESS(f"speedup:    {results['speedup']:.1f}x (identical output)"))
@@ -0,0 +1,27 @@
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from core.utils import get_config
+from exploration.benchmarks import backtest_forecast_modes
+from exploration.constants import DIR_NAME, FILENAME, COL_ORDERS, COL_EARNINGS, SERIES_OPERATIONS
+from exploration.registry import get_model
+from exploration.utils import load_customer_series, model_name
+
+
+class Command(BaseCommand):
+    help = 'Compare the latency and accuracy of the recursive and direct forecast modes on a backtest of customer series.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--col', choices=[COL_ORDERS, COL_EARNINGS], default=COL_ORDERS)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--origins', type=int, default=5)
+        parser.add_argument('--horizon', type=int, help='Days forecast from each origin, NUM_PREDICTION by default')
+        parser.add_argument('--filename', default=FILENAME)
+
+    def handle(self, *args, **options):
+        store = load_customer_series(DIR_NAME, options['filename'], options['col'], SERIES_OPERATIONS[options['col']])
+        results = backtest_forecast_modes(get_model(model_name(options['col'])), store,
+                                          options['horizon'] or get_config('NUM_PREDICTION', cast=int),
+                                          customers=options['customers'], origins=options['origins'])
+
+        self.stdout.write(pd.DataFrame(results).to_string(index=False))
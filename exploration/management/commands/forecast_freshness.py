@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from exploration.constants import DIR_NAME
+from exploration.precompute import freshness_report
+
+
+class Command(BaseCommand):
+    help = 'Report the age and validity of the precomputed forecasts of each input file and metric, totals and per customer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir-name', default=DIR_NAME)
+
+    def handle(self, *args, **options):
+        for series, entry in freshness_report(options['dir_name']).items():
+            line = f"{series}: {entry['status']}, {entry['forecasts']} forecasts"
+            if entry['forecasts']:
+                line += f", computed {entry['computed_at']} ({entry['age_seconds']:.0f}s ago)"
+            if entry.get('stale_reasons'):
+                line += f" - {', '.join(entry['stale_reasons'])}"
+            style = self.style.SUCCESS if entry['status'] == 'fresh' else self.style.WARNING
+            self.stdout.write(style(line))
@@ -0,0 +1,45 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exploration.constants import DIR_NAME, FILENAME
+from exploration.ingest import IngestConflict, ingest_batch, read_batch
+from exploration.precompute import precompute_forecasts
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Append a batch of order rows (csv or ndjson) to the input csv and update the cached aggregates in place.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch', help='csv file with a header, or .ndjson/.jsonl file with one order per line')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='format of the batch, guessed from its extension by default')
+        parser.add_argument('--dir-name', default=DIR_NAME)
+        parser.add_argument('--filename', default=FILENAME)
+        parser.add_argument('--precompute', action='store_true', help='refresh the precomputed forecasts after the batch')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('ndjson' if options['batch'].endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        start = time.perf_counter()
+        try:
+            with open(options['batch']) as f:
+                batch = read_batch(f.read(), fmt)
+            summary = ingest_batch(options['dir_name'], batch, options['filename'])
+        except (OSError, ValueError, IngestConflict) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['rows']} rows ingested into {options['filename']} in {elapsed:.2f}s: {len(summary['days'])} days "
+            f"({summary['new_days']} new), {summary['customers']} customers, {summary['duplicates']} duplicates"))
+        for name, rows in summary['files'].items():
+            self.stdout.write(self.style.SUCCESS(f"{rows} rows of their customers ingested into {name}"))
+
+        if options['precompute']:
+            start = time.perf_counter()
+            stored = precompute_forecasts(options['dir_name'])
+            self.stdout.write(self.style.SUCCESS(f"{sum(stored.values())} forecasts precomputed in {time.perf_counter() - start:.2f}s"))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exploration.constants import DIR_NAME
+from exploration.precompute import precompute_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Store the forecasts of the daily totals and of every customer in the Forecast table (run nightly through CRONJOBS).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir-name', default=DIR_NAME)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        summary = precompute_forecasts(options['dir_name'])
+
+        for series, stored in summary.items():
+            self.stdout.write(f"{series}: {stored} forecasts")
+        self.stdout.write(self.style.SUCCESS(f"{sum(summary.values())} forecasts stored in {time.perf_counter() - start:.2f}s"))
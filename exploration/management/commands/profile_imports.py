@@ -0,0 +1,42 @@
+import json
+
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from exploration.startup import HEAVY_MODULES, import_profile
+
+
+class Command(BaseCommand):
+    help = ('Profile the imports of a worker or a command starting up (the url configuration by default) with '
+            'python -X importtime, list the slowest modules and the heavy dependencies imported on the way.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default=settings.ROOT_URLCONF, help='Module to import after django.setup()')
+        parser.add_argument('--top', type=int, default=25, help='Modules listed, by cumulative import time')
+        parser.add_argument('--output', help='Write the full report as json')
+        parser.add_argument('--fail-on-heavy', action='store_true',
+                            help=f"Fail when one of {', '.join(HEAVY_MODULES)} is imported")
+
+    def handle(self, *args, **options):
+        try:
+            report = import_profile(options['module'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        modules = pd.DataFrame(report['modules']).sort_values('cumulative_ms', ascending=False).head(options['top'])
+        self.stdout.write(modules.to_string(index=False))
+        self.stdout.write(f"{options['module']} imported in {report['seconds']:.2f}s, {len(report['modules'])} modules")
+
+        if report['heavy']:
+            message = f"Heavy dependencies imported at startup: {', '.join(report['heavy'])}"
+            if options['fail_on_heavy']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No heavy dependency imported at startup'))
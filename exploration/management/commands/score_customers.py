@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exploration.constants import DIR_NAME, FILENAME_ORDERS
+from exploration.results import ExportInProgress, export_predictions
+
+
+class Command(BaseCommand):
+    help = 'Predict the orders and values of all the customers of a file on a local process pool and append them to the results file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir-name', default=DIR_NAME)
+        parser.add_argument('--filename', default=FILENAME_ORDERS)
+        parser.add_argument('--workers', type=int, default=None, help='Defaults to PREDICTION_WORKERS')
+        parser.add_argument('--shards', type=int, default=None, help='Defaults to PREDICTION_SHARDS')
+        parser.add_argument('--format', choices=['csv', 'parquet'], default=None, help='Defaults to RESULTS_FORMAT')
+        parser.add_argument('--output', default=None, help='Defaults to results.csv or results.parquet')
+        parser.add_argument('--restart', action='store_true', help='Do not resume an interrupted run')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            path, scored, resumed = export_predictions(options['dir_name'], options['filename'],
+                                                       path=options['output'], fmt=options['format'],
+                                                       resume=not options['restart'],
+                                                       workers=options['workers'], shards=options['shards'])
+        except ExportInProgress as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"{scored} customers scored ({resumed} resumed) in "
+                                             f"{time.perf_counter() - start:.2f}s, written to {path}"))
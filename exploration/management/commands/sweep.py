@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exploration.constants import COL_ORDERS, COL_EARNINGS, LOOKBACK, PREDICTION_HORIZON
+from exploration.jobs import training_parameters
+from exploration.sweep import sweep_trials, run_sweep
+
+
+def int_list(value):
+    return [int(i) for i in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = ('Train candidate LSTM configurations concurrently and write a leaderboard with the MAPE, '
+            'fit time and inference latency of each. Parameters are comma separated lists, the .env values by default.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--col', choices=[COL_ORDERS, COL_EARNINGS], default=COL_ORDERS)
+        parser.add_argument('--neurons', type=int_list)
+        parser.add_argument('--epochs', type=int_list)
+        parser.add_argument('--batch-size', type=int_list)
+        parser.add_argument('--lookback', type=int_list, default=[LOOKBACK])
+        parser.add_argument('--horizon', type=int_list, default=[PREDICTION_HORIZON])
+        parser.add_argument('--search', choices=['grid', 'random'], default='grid')
+        parser.add_argument('--trials', type=int, help='Number of configurations drawn by a random search (or the first ones of the grid)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, help='Defaults to SWEEP_WORKERS, all the cores if 0')
+        parser.add_argument('--output', default='sweep_leaderboard.csv')
+
+    def handle(self, *args, **options):
+        defaults = training_parameters(options['col'])
+        space = {
+            'neurons': options['neurons'] or [defaults['neurons']],
+            'epochs': options['epochs'] or [defaults['epochs']],
+            'batch_size': options['batch_size'] or [defaults['batch_size']],
+            'lookback': options['lookback'],
+            'prediction_horizon': options['horizon'],
+        }
+        configs = sweep_trials(space, options['search'], options['trials'], options['seed'])
+        if not configs:
+            raise CommandError('Empty search space')
+
+        start = time.perf_counter()
+        leaderboard = run_sweep(options['col'], configs, options['workers'])
+        leaderboard.to_csv(options['output'], index=False)
+
+        self.stdout.write(leaderboard.to_string(index=False))
+        self.stdout.write(self.style.SUCCESS(f"{len(configs)} trials in {time.perf_counter() - start:.2f}s, "
+                                             f"leaderboard written to {options['output']}"))
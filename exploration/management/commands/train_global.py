@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from sklearn.metrics import mean_absolute_percentage_error
+
+from exploration.constants import COL_ORDERS, COL_EARNINGS, LOOKBACK, PREDICTION_HORIZON
+from exploration.jobs import training_parameters
+from exploration.models import TrainingJob
+from exploration.global_training import prepare_global_model
+
+
+class Command(BaseCommand):
+    help = 'Train the model of a column on the series of every customer and report the training throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--col', choices=[COL_ORDERS, COL_EARNINGS], default=COL_ORDERS)
+        parser.add_argument('--neurons', type=int)
+        parser.add_argument('--epochs', type=int)
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        parameters = training_parameters(options['col'], TrainingJob.GLOBAL)
+        for name in parameters:
+            if options[name] is not None:
+                parameters[name] = options[name]
+
+        Y_test, test_predict, stats = prepare_global_model(options['col'], **parameters,
+                                                           lookback=LOOKBACK, prediction_horizon=PREDICTION_HORIZON)
+
+        self.stdout.write(f"{stats['customers']} customers, {stats['windows']} windows in {stats['fit_seconds']}s: "
+                          f"{stats['windows_per_second']} windows/s, peak memory {stats['peak_memory_mb']} MB")
+        self.stdout.write(self.style.SUCCESS(
+            f"Model of {options['col']} saved, MAPE on the daily totals {mean_absolute_percentage_error(Y_test, test_predict):.4f}"))
@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from exploration.constants import LOOKBACK, COL_ORDERS, COL_EARNINGS
+from exploration.lstm_numpy import NumpyLSTMModel
+
+
+class Command(BaseCommand):
+    help = 'Compare the outputs and latency of the numpy inference backend with keras on random windows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=1024)
+        parser.add_argument('--tolerance', type=float, default=1e-4)
+
+    def handle(self, *args, **options):
+        from tensorflow.keras.models import load_model
+
+        x = np.random.default_rng(0).random((options['samples'], LOOKBACK, 1)).astype(np.float32)
+        failed = []
+
+        for col in [COL_ORDERS, COL_EARNINGS]:
+            path = 'model_' + col + '.h5'
+            keras_model = load_model(path)
+            numpy_model = NumpyLSTMModel.from_h5(path)
+
+            start = time.perf_counter()
+            expected = np.asarray(keras_model(x, training=False))
+            keras_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            actual = numpy_model(x)
+            numpy_time = time.perf_counter() - start
+
+            error = float(np.max(np.abs(expected - actual)))
+            self.stdout.write(f"{path}: max abs error {error:.2e}, keras {keras_time * 1000:.1f}ms, "
+                              f"numpy {numpy_time * 1000:.1f}ms for {len(x)} windows")
+            if error > options['tolerance']:
+                failed.append(path)
+
+        if failed:
+            raise CommandError(f"Numpy backend differs from keras above {options['tolerance']} for {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS('Numpy backend matches keras'))
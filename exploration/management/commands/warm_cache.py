@@ -0,0 +1,26 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+
+from exploration.constants import DIR_NAME, FILENAME
+from exploration.utils import preprocess_all_data
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Build or validate the cached daily aggregate so that the first request does not parse the raw csv.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir-name', default=DIR_NAME)
+        parser.add_argument('--filename', default=FILENAME)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        df_lstm = preprocess_all_data(options['dir_name'], options['filename'])
+        elapsed = time.perf_counter() - start
+
+        logger.info(f"Cache warmed for {options['filename']}: {len(df_lstm)} days in {elapsed:.2f}s.")
+        self.stdout.write(self.style.SUCCESS(f"{len(df_lstm)} days cached for {options['filename']} in {elapsed:.2f}s"))
@@ -0,0 +1,219 @@
+import os
+import time
+import resource
+import functools
+import threading
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+
+from core.utils import get_config
+
+
+# Stage timings of the request being served: stage name -> [milliseconds, calls]
+_request_timings = ContextVar('request_timings', default=None)
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_bytes():
+    """
+    Resident memory of this process, from /proc on linux, the peak resident memory elsewhere.
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageMetrics:
+    """
+    Process wide totals of the instrumented stages: calls, wall time, cpu time, rows processed and resident memory delta.
+    Each gunicorn worker (and each background process) keeps its own totals, METRICS_ENABLED=False in .env turns them off.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._stages = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, wall, cpu, rows, rss_delta):
+        with self._lock:
+            totals = self._stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'rss_delta': 0})
+            totals['calls'] += 1
+            totals['wall'] += wall
+            totals['cpu'] += cpu
+            totals['rows'] += rows
+            totals['rss_delta'] = rss_delta
+
+        timings = _request_timings.get()
+        if timings is not None:
+            timing = timings.setdefault(name, [0.0, 0])
+            timing[0] += 1000 * wall
+            timing[1] += 1
+
+    def record_request(self, view, status, wall):
+        with self._lock:
+            totals = self._requests.setdefault((view, status), {'calls': 0, 'wall': 0.0})
+            totals['calls'] += 1
+            totals['wall'] += wall
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+            self._requests.clear()
+
+    def prometheus(self):
+        """
+        Totals in the Prometheus text exposition format.
+        """
+
+        with self._lock:
+            stages = {name: dict(totals) for name, totals in self._stages.items()}
+            requests = {key: dict(totals) for key, totals in self._requests.items()}
+
+        lines = []
+
+        def family(name, kind, text, samples):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{labels} {value!r}' for labels, value in samples)
+
+        for name, kind, key, text in [
+                ('exploration_stage_calls_total', 'counter', 'calls', 'Calls of each instrumented stage.'),
+                ('exploration_stage_seconds_total', 'counter', 'wall', 'Wall time spent in each stage.'),
+                ('exploration_stage_cpu_seconds_total', 'counter', 'cpu', 'Process cpu time spent in each stage.'),
+                ('exploration_stage_rows_total', 'counter', 'rows', 'Rows processed by each stage.'),
+                ('exploration_stage_rss_delta_bytes', 'gauge', 'rss_delta', 'Resident memory delta of the last call of each stage.')]:
+            family(name, kind, text, [(f'{{stage="{stage}"}}', totals[key]) for stage, totals in sorted(stages.items())])
+
+        family('exploration_http_requests_total', 'counter', 'Requests served by each view.',
+               [(f'{{view="{view}",status="{status}"}}', totals['calls']) for (view, status), totals in sorted(requests.items())])
+        family('exploration_http_request_seconds_total', 'counter', 'Wall time spent serving the requests of each view.',
+               [(f'{{view="{view}",status="{status}"}}', totals['wall']) for (view, status), totals in sorted(requests.items())])
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        family('process_cpu_seconds_total', 'counter', 'User and system cpu time of this process.', [('', usage.ru_utime + usage.ru_stime)])
+        family('process_resident_memory_bytes', 'gauge', 'Resident memory of this process.', [('', rss_bytes())])
+        family('process_start_time_seconds', 'gauge', 'Start time of the metrics of this process.', [('', self.started_at)])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = StageMetrics(get_config('METRICS_ENABLED', True, cast=bool))
+
+
+class stage:
+    """
+    Context manager measuring one stage of the pipeline, e.g.
+        with stage('model_fit', rows=len(X_train)):
+            model.fit(...)
+    rows can also be set on the stage inside the block. Disabled, it only checks a flag.
+    """
+
+    __slots__ = ('name', 'rows', 'wall', 'cpu', 'rss')
+
+    def __init__(self, name, rows=0):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        if metrics.enabled:
+            self.rss = rss_bytes()
+            self.cpu = time.process_time()
+            self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if metrics.enabled:
+            wall = time.perf_counter() - self.wall
+            metrics.record(self.name, wall, time.process_time() - self.cpu, int(self.rows or 0), rss_bytes() - self.rss)
+        return False
+
+
+def timed(name, rows=None):
+    """
+    Decorator measuring every call of a function as the stage name, rows(result) gives the rows processed.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with stage(name) as measured:
+                result = function(*args, **kwargs)
+                if rows is not None:
+                    measured.rows = rows(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def server_timing(timings, total):
+    """
+    Server-Timing header value of the stages of a request, in milliseconds.
+    """
+
+    entries = [f'{name};dur={ms:.1f}' + (f';desc="{calls} calls"' if calls > 1 else '') for name, (ms, calls) in timings.items()]
+    return ', '.join(entries + [f'total;dur={1000 * total:.1f}'])
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request, record it per view and attach the timings of its stages as a Server-Timing header.
+    Runs natively under WSGI and ASGI, so that it does not force the async views back onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not metrics.enabled:
+            return self.get_response(request)
+
+        token = _request_timings.set({})
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            return self.finish(request, response, time.perf_counter() - start)
+        finally:
+            _request_timings.reset(token)
+
+    async def __acall__(self, request):
+        if not metrics.enabled:
+            return await self.get_response(request)
+
+        token = _request_timings.set({})
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            return self.finish(request, response, time.perf_counter() - start)
+        finally:
+            _request_timings.reset(token)
+
+    def finish(self, request, response, total):
+        response['Server-Timing'] = server_timing(_request_timings.get(), total)
+        match = getattr(request, 'resolver_match', None)
+        metrics.record_request(match.url_name if match and match.url_name else 'unmatched', response.status_code, total)
+        return response
+
+
+def metrics_view(request):
+    """
+    Stage and request totals of this worker, scraped by Prometheus.
+    """
+
+    return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exploration', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='mode',
+            field=models.CharField(choices=[('aggregate', 'Aggregated daily series'), ('global', 'All customer series')], default='aggregate', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='trainingjob',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
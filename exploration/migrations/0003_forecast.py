@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exploration', '0002_trainingjob_mode_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Forecast',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=128)),
+                ('metric', models.CharField(max_length=64)),
+                ('customer_id', models.CharField(max_length=64)),
+                ('first_date', models.DateField()),
+                ('values', models.JSONField()),
+                ('horizon', models.IntegerField()),
+                ('mode', models.CharField(max_length=16)),
+                ('model_version', models.CharField(max_length=16)),
+                ('data_version', models.CharField(max_length=64)),
+                ('computed_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='forecast',
+            constraint=models.UniqueConstraint(fields=('source', 'metric', 'customer_id'), name='unique_forecast'),
+        ),
+    ]
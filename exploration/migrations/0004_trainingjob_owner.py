@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exploration', '0003_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='owner',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+    ]
@@ -1,3 +1,98 @@
 from django.db import models
 
-# Create your models here.
+
+class TrainingJob(models.Model):
+    """
+    A training run of the generalized LSTM model of a column, executed in the background worker pool.
+    The model is trained on the aggregated daily series, or on the series of every customer in global mode.
+    """
+
+    AGGREGATE = 'aggregate'
+    GLOBAL = 'global'
+    MODE_CHOICES = [
+        (AGGREGATE, 'Aggregated daily series'),
+        (GLOBAL, 'All customer series'),
+    ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    col = models.CharField(max_length=64)
+    mode = models.CharField(max_length=16, choices=MODE_CHOICES, default=AGGREGATE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    epoch = models.IntegerField(default=0)
+    epochs = models.IntegerField()
+    loss = models.FloatField(null=True, blank=True)
+    mape = models.FloatField(null=True, blank=True)
+    artifact = models.CharField(max_length=255, blank=True)
+    actual = models.JSONField(null=True, blank=True)
+    predicted = models.JSONField(null=True, blank=True)
+    stats = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    # Web process whose pool runs the job, host:pid:token
+    owner = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.col} training job {self.pk} ({self.status})"
+
+    def as_dict(self):
+        return {
+            'job_id': self.pk,
+            'col': self.col,
+            'mode': self.mode,
+            'status': self.status,
+            'epoch': self.epoch,
+            'epochs': self.epochs,
+            'loss': self.loss,
+            'mape': self.mape,
+            'artifact': self.artifact,
+            'stats': self.stats,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class Forecast(models.Model):
+    """
+    Precomputed forecast of a metric for one customer of an input file, or for all of them (customer_id 'all').
+    values holds the last known value followed by the predictions, as predict_new_values returns them.
+    data_version is the digest of the series it was computed from (window_digest of its last LOOKBACK days),
+    the forecast is fresh while the series of its customer and the served model are the ones it was computed from.
+    """
+
+    ALL_CUSTOMERS = 'all'
+
+    source = models.CharField(max_length=128)
+    metric = models.CharField(max_length=64)
+    customer_id = models.CharField(max_length=64)
+    first_date = models.DateField()
+    values = models.JSONField()
+    horizon = models.IntegerField()
+    mode = models.CharField(max_length=16)
+    model_version = models.CharField(max_length=16)
+    data_version = models.CharField(max_length=64)
+    computed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'metric', 'customer_id'], name='unique_forecast'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} forecast of {self.customer_id} ({self.source})"
@@ -0,0 +1,104 @@
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from core.utils import get_config
+from exploration.constants import COL_ORDERS, COL_EARNINGS
+from exploration.workers import init_prediction_worker
+from exploration.utils import load_customer_series, predict_customers
+
+
+logger = logging.getLogger(__name__)
+
+# Columns of the per customer predictions, as exported to results.csv
+RESULT_COLUMNS = ['customer_id', 'orders_predictions', 'values_predictions']
+
+
+def prediction_workers():
+    """
+    Number of processes scoring customers, PREDICTION_WORKERS in .env, all the cores by default.
+    """
+
+    return get_config('PREDICTION_WORKERS', os.cpu_count() or 1, cast=int) or os.cpu_count() or 1
+
+
+def prediction_shards(workers):
+    """
+    Number of shards the customers are split into, PREDICTION_SHARDS in .env, 4 per worker by default.
+    """
+
+    return get_config('PREDICTION_SHARDS', 4 * workers, cast=int) or 4 * workers
+
+
+def score_customers(df_orders, df_values, customer_ids):
+    """
+    Sum of the predicted orders and values of each customer, one row per customer as in results.csv.
+    """
+
+    prediction_dates, predictions_orders = predict_customers(COL_ORDERS, df_orders, customer_ids)
+    prediction_dates, predictions_values = predict_customers(COL_EARNINGS, df_values, customer_ids)
+
+    return pd.DataFrame({'customer_id': [str(i) for i in customer_ids],
+                         'orders_predictions': predictions_orders.astype(int).sum(axis=1),
+                         'values_predictions': predictions_values.sum(axis=1)})
+
+
+def score_shard(dir_name, filename, shard, customer_ids):
+    """
+    Score one shard of customers inside a worker, the series stores come from the on-disk cache.
+    """
+
+    start = time.perf_counter()
+    df_orders = load_customer_series(dir_name, filename, COL_ORDERS, 'count')
+    df_values = load_customer_series(dir_name, filename, COL_EARNINGS, 'sum')
+    results = score_customers(df_orders, df_values, customer_ids)
+
+    logger.info(f"Shard {shard} scored {len(customer_ids)} customers in {time.perf_counter() - start:.2f}s (pid {os.getpid()}).")
+    return shard, results
+
+
+def iter_scored_shards(dir_name, filename, customer_ids=None, workers=None, shards=None):
+    """
+    Score customers of a file shard by shard across a pool of processes, all the customers by default.
+    Yields (shard index, results) as soon as each shard completes, in completion order.
+    """
+
+    workers = workers or prediction_workers()
+    shards = shards or prediction_shards(workers)
+
+    if customer_ids is None:
+        customer_ids = load_customer_series(dir_name, filename, COL_ORDERS, 'count').customer_ids
+    if not len(customer_ids):
+        return
+    shards = np.array_split(np.asarray(customer_ids), min(shards, len(customer_ids)))
+    logger.info(f"Scoring {len(customer_ids)} customers in {len(shards)} shards on {workers} workers.")
+
+    if workers == 1:
+        for i, shard in enumerate(shards):
+            yield score_shard(dir_name, filename, i, shard)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_prediction_worker) as pool:
+        futures = [pool.submit(score_shard, dir_name, filename, i, shard) for i, shard in enumerate(shards)]
+        for done, future in enumerate(as_completed(futures), start=1):
+            yield future.result()
+            logger.info(f"{done}/{len(shards)} shards done.")
+
+
+def score_all_customers(dir_name, filename, workers=None, shards=None):
+    """
+    Predictions of all the customers of a file, sharded across a pool of processes.
+    Shards are merged back in customer order as they complete.
+    """
+
+    results = dict(iter_scored_shards(dir_name, filename, workers=workers, shards=shards))
+    if not results:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat([results[i] for i in sorted(results)], ignore_index=True)
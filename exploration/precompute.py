@@ -0,0 +1,249 @@
+import time
+import logging
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from core.utils import get_config
+from exploration.constants import (DIR_NAME, FILENAME, FILENAME_ORDERS, FILENAME_ORDER_VALUES, COL_ORDERS, COL_EARNINGS,
+                                   LOOKBACK, MAX_CUSTOMER_IDS, SERIES_OPERATIONS)
+from exploration.forecast_cache import window_digest
+from exploration.models import Forecast
+from exploration.parallel import RESULT_COLUMNS
+from exploration.registry import registry
+from exploration.results import ResultsWriter, results_path
+from exploration.series_store import CustomerSeriesStore
+from exploration.utils import forecast_mode, load_customer_series, model_name, predict_customers, predict_new_values, preprocess_all_data
+
+
+logger = logging.getLogger(__name__)
+
+# Forecasts of the daily totals of all the customers, as (input file, metric)
+TOTAL_FORECASTS = [(FILENAME, COL_ORDERS), (FILENAME, COL_EARNINGS)]
+
+# Forecasts of every customer, as (input file, metric): the files read by the per customer endpoints,
+# FILENAME for the customer lookups and the top customers files for data_predict_per_customer
+CUSTOMER_FORECASTS = [(FILENAME, COL_ORDERS), (FILENAME, COL_EARNINGS),
+                      (FILENAME_ORDERS, COL_ORDERS), (FILENAME_ORDERS, COL_EARNINGS), (FILENAME_ORDER_VALUES, COL_EARNINGS)]
+
+# Every precomputed series, as (input file, metric, per customer)
+FORECAST_SERIES = [(source, col, False) for source, col in TOTAL_FORECASTS] + [(source, col, True) for source, col in CUSTOMER_FORECASTS]
+
+
+def series_name(source, col, customers):
+    return f'{source}:{col}:customers' if customers else f'{source}:{col}'
+
+
+def series_digests(col, data, customer_ids=None):
+    """
+    Digest of the input of the forecast of col of each customer of an input file (window_digest of forecast_cache),
+    as customer_id -> digest, for all the customers by default. data is the daily aggregate for the daily totals,
+    the CustomerSeriesStore otherwise. A digest only changes when the last LOOKBACK days, the scaling
+    or the last known day of the series change.
+    """
+
+    if not isinstance(data, CustomerSeriesStore):
+        values = data[col].values
+        return {Forecast.ALL_CUSTOMERS: window_digest(values[-LOOKBACK:], values.min(), values.max(), data['created_at'].values[-1])}
+
+    windows, data_min, data_max = data.windows(customer_ids, LOOKBACK)
+    customer_ids = data.customer_ids if customer_ids is None else customer_ids
+    return {str(customer_id): window_digest(window, low, high, data.last_date)
+            for customer_id, window, low, high in zip(customer_ids, windows, data_min, data_max)}
+
+
+def load_series(source, col, customers, dir_name=DIR_NAME):
+    if customers:
+        return load_customer_series(dir_name, source, col, SERIES_OPERATIONS[col])
+    return preprocess_all_data(dir_name, source)
+
+
+def forecast_rows(source, metric, customers):
+    rows = Forecast.objects.filter(source=source, metric=metric)
+    return rows.exclude(customer_id=Forecast.ALL_CUSTOMERS) if customers else rows.filter(customer_id=Forecast.ALL_CUSTOMERS)
+
+
+def store_forecasts(source, metric, first_date, forecasts, model_version, computed_at):
+    """
+    Replace the forecasts of a metric of an input file in one transaction, readers never see a partial run.
+    forecasts maps each customer_id to its values and the digest of the series they were computed from.
+    """
+
+    mode = forecast_mode()
+    rows = [Forecast(source=source, metric=metric, customer_id=str(customer_id), first_date=first_date,
+                     values=[float(i) for i in values], horizon=len(values) - 1, mode=mode,
+                     model_version=model_version, data_version=digest, computed_at=computed_at)
+            for customer_id, (values, digest) in forecasts.items()]
+
+    with transaction.atomic():
+        Forecast.objects.bulk_create(rows, batch_size=get_config('PRECOMPUTE_BATCH_SIZE', 2000, cast=int),
+                                     update_conflicts=True, unique_fields=['source', 'metric', 'customer_id'],
+                                     update_fields=['first_date', 'values', 'horizon', 'mode', 'model_version',
+                                                    'data_version', 'computed_at'])
+        # Customers gone from the input file
+        forecast_rows(source, metric, Forecast.ALL_CUSTOMERS not in forecasts).filter(computed_at__lt=computed_at).delete()
+    return len(rows)
+
+
+def precompute_forecasts(dir_name=DIR_NAME):
+    """
+    Refresh the cached aggregates and store the forecasts of the daily totals and of every customer in the Forecast table,
+    so that the prediction endpoints only look them up. Only the series that changed since the stored forecasts
+    were computed are predicted again. Returns the number of forecasts stored per series (see series_name).
+    """
+
+    summary = {}
+    computed_at = timezone.now()
+
+    for source, col, customers in FORECAST_SERIES:
+        start = time.perf_counter()
+        data = load_series(source, col, customers, dir_name)
+        digests = series_digests(col, data)
+        stored = fresh_forecasts(source, col, digests)
+        changed = [i for i in digests if i not in stored]
+
+        if not customers:
+            prediction_dates, prediction_list = (predict_new_values(col, data) if changed
+                                                 else forecast_dates(*stored[Forecast.ALL_CUSTOMERS]))
+            predictions = {Forecast.ALL_CUSTOMERS: prediction_list}
+        else:
+            prediction_dates, predictions = pd.date_range(data.last_date, periods=get_config('NUM_PREDICTION', cast=int) + 1).tolist(), {}
+            if changed:
+                prediction_dates, computed = predict_customers(col, data, [int(i) for i in changed])
+                predictions.update(zip(changed, computed))
+
+        forecasts = {customer_id: (predictions[customer_id] if customer_id in predictions else stored[customer_id][1], digest)
+                     for customer_id, digest in digests.items()}
+        summary[series_name(source, col, customers)] = store_forecasts(source, col, prediction_dates[0].date(), forecasts,
+                                                                       registry.version(model_name(col)), computed_at)
+        logger.info(f"Forecasts of {series_name(source, col, customers)} stored in {time.perf_counter() - start:.2f}s, "
+                    f"{len(changed)} of {len(digests)} series changed.")
+
+    return summary
+
+
+def fresh_forecasts(source, metric, digests, num_prediction=None):
+    """
+    Stored forecasts of a metric of an input file that are still valid, as customer_id -> (first_date, values):
+    computed from the same series (digests maps each customer_id to the digest of its series now, see series_digests),
+    with the served model, horizon (NUM_PREDICTION by default) and FORECAST_MODE of now.
+    """
+
+    rows = Forecast.objects.filter(source=source, metric=metric,
+                                   model_version=registry.version(model_name(metric)),
+                                   horizon=num_prediction or get_config('NUM_PREDICTION', cast=int),
+                                   mode=forecast_mode())
+    if len(digests) <= MAX_CUSTOMER_IDS:
+        rows = rows.filter(customer_id__in=list(digests))
+
+    return {customer_id: (first_date, values)
+            for customer_id, data_version, first_date, values in rows.values_list('customer_id', 'data_version', 'first_date', 'values')
+            if digests.get(customer_id) == data_version}
+
+
+def forecast_dates(first_date, values):
+    return pd.date_range(first_date, periods=len(values)).tolist(), values
+
+
+def forecast_values(source, col, load, num_prediction=None):
+    """
+    predict_new_values(col, load(), num_prediction) served from the Forecast table when the stored forecast
+    was computed from the same series.
+    """
+
+    data = load()
+    metric = model_name(col)
+    if ':' in col:
+        customer_id = col.split(':')[0].replace("'", "")
+        digests = series_digests(metric, data, [customer_id])
+    else:
+        customer_id = Forecast.ALL_CUSTOMERS
+        digests = series_digests(metric, data)
+
+    stored = fresh_forecasts(source, metric, digests, num_prediction).get(customer_id)
+    if stored is None:
+        return predict_new_values(col, data, num_prediction)
+    return forecast_dates(*stored)
+
+
+def stored_predictions(source, dir_name=DIR_NAME):
+    """
+    Sums of the predicted orders and values of every customer of an input file, as score_customers returns them,
+    from the Forecast table. None unless the forecasts of both metrics are fresh for every customer.
+    """
+
+    frames = {}
+    for col in (COL_ORDERS, COL_EARNINGS):
+        digests = series_digests(col, load_customer_series(dir_name, source, col, SERIES_OPERATIONS[col]))
+        stored = fresh_forecasts(source, col, digests)
+        if not stored or len(stored) != len(digests):
+            return None
+        frames[col] = pd.Series({customer_id: values for customer_id, (_, values) in stored.items()}).sort_index()
+
+    return pd.DataFrame({'customer_id': frames[COL_ORDERS].index,
+                         'orders_predictions': [sum(int(i) for i in values) for values in frames[COL_ORDERS]],
+                         'values_predictions': [sum(values) for values in frames[COL_EARNINGS].loc[frames[COL_ORDERS].index]]})[RESULT_COLUMNS]
+
+
+def export_stored_predictions(source, path=None, fmt=None, dir_name=DIR_NAME):
+    """
+    Write the stored predictions of every customer to the results file, as export_predictions does.
+    Returns the path and the number of customers, or None when the stored forecasts are not fresh.
+    """
+
+    results = stored_predictions(source, dir_name)
+    if results is None:
+        return None
+
+    fmt = fmt or get_config('RESULTS_FORMAT', 'csv')
+    with ResultsWriter(path or results_path(fmt), fmt, get_config('RESULTS_BATCH_SIZE', 10000, cast=int)) as writer:
+        writer.start(resume=False)
+        writer.write(results)
+        writer.complete()
+    return writer.path, writer.written
+
+
+def freshness_report(dir_name=DIR_NAME):
+    """
+    Age and validity of the stored forecasts of each series (see series_name): stale when the series of some customers changed,
+    the model was retrained or the forecast settings changed since they were computed, missing when never precomputed.
+    """
+
+    now = timezone.now()
+    report = {}
+    for source, col, customers in FORECAST_SERIES:
+        entry = report[series_name(source, col, customers)] = {'source': source, 'metric': col, 'customers': customers,
+                                                               'forecasts': 0, 'status': 'missing'}
+        rows = forecast_rows(source, col, customers)
+        if not rows.exists():
+            continue
+
+        digests = series_digests(col, load_series(source, col, customers, dir_name))
+        stored = dict(rows.values_list('customer_id', 'data_version'))
+        changed = sum(digests.get(customer_id) != digest for customer_id, digest in stored.items())
+        unseen = sum(customer_id not in stored for customer_id in digests)
+
+        reasons = []
+        if changed:
+            reasons.append(f'series of {changed} customers changed')
+        if unseen:
+            reasons.append(f'{unseen} customers never precomputed')
+        if rows.exclude(model_version=registry.version(model_name(col))).exists():
+            reasons.append('model retrained')
+        if rows.exclude(horizon=get_config('NUM_PREDICTION', cast=int), mode=forecast_mode()).exists():
+            reasons.append('forecast settings changed')
+
+        group = rows.aggregate(forecasts=Count('id'), oldest=Min('computed_at'), newest=Max('computed_at'),
+                               model_version=Max('model_version'))
+        entry.update({
+            'forecasts': group['forecasts'],
+            'status': 'stale' if reasons else 'fresh',
+            'stale_reasons': reasons,
+            'stale_customers': changed,
+            'model_version': group['model_version'],
+            'computed_at': group['newest'].isoformat(),
+            'age_seconds': round((now - group['oldest']).total_seconds(), 1),
+        })
+    return report
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+
+from core.utils import get_config
+from exploration.metrics import stage
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_inference_model(path):
+    """
+    Load a saved model with the backend set in .env through INFERENCE_BACKEND:
+    'keras' (default) or 'numpy', which runs the LSTM in NumPy without importing tensorflow.
+    """
+
+    backend = get_config('INFERENCE_BACKEND', 'keras')
+    if backend == 'numpy':
+        from exploration.lstm_numpy import NumpyLSTMModel
+        return NumpyLSTMModel.from_h5(path)
+
+    from tensorflow.keras.models import load_model
+    return load_model(path)
+
+
+def file_version(path):
+    """
+    Version of a saved model: prefix of the sha256 of its file.
+    """
+
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+class LoadedModel:
+    """
+    A model kept in memory together with the file state it was loaded from.
+    """
+
+    def __init__(self, model, path, size, mtime_ns, version):
+        self.model = model
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.version = version
+        self.loaded_at = datetime.now(timezone.utc)
+
+    def is_current(self, stat):
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+    def info(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'loaded_at': self.loaded_at.isoformat(),
+        }
+
+
+class ModelRegistry:
+    """
+    Process wide registry of the saved LSTM models (model_<name>.h5).
+    Each model is loaded once per worker and reloaded only when its file changes on disk, e.g. after retraining.
+    Loading is serialized with a lock, so concurrent threads of a worker never load the same model twice.
+    """
+
+    def __init__(self, loader=load_inference_model):
+        self._loader = loader
+        self._models = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(os.getcwd(), 'model_' + name + '.h5')
+
+    def get(self, name):
+        """
+        In-memory model for name, loading or hot-reloading it when needed.
+        """
+
+        path = self.path(name)
+        entry = self._models.get(name)
+        if entry is not None and entry.is_current(os.stat(path)):
+            return entry.model
+
+        with self._lock:
+            stat = os.stat(path)
+            entry = self._models.get(name)
+            if entry is not None and entry.is_current(stat):
+                return entry.model
+
+            try:
+                version = file_version(path)
+                if entry is not None and entry.version == version:
+                    # Touched but not rewritten
+                    entry.size, entry.mtime_ns = stat.st_size, stat.st_mtime_ns
+                    return entry.model
+                with stage('load_model'):
+                    model = self._loader(path)
+            except (OSError, ValueError) as e:
+                # A model file being rewritten by a training run, keep serving the previous one
+                if entry is None:
+                    raise
+                logger.warning(f"Could not reload model {name}, serving version {entry.version}: {e}")
+                return entry.model
+
+            if os.stat(path).st_mtime_ns != stat.st_mtime_ns:
+                # Rewritten while loading, do not record the file state so that the next call reloads it
+                stat = None
+            self._models[name] = LoadedModel(model, path, stat.st_size if stat else -1,
+                                             stat.st_mtime_ns if stat else -1, version)
+            logger.info(f"Model {name} loaded, version {version}.")
+
+        return model
+
+    def version(self, name):
+        """
+        Version (content hash prefix) of the model served for name. Only the model file is read, the model itself
+        is not loaded, so that it is cheap enough for the event loop. The hash of the file is kept until it changes.
+        """
+
+        path = self.path(name)
+        stat = os.stat(path)
+        entry = self._models.get(name)
+        if entry is not None and entry.is_current(stat):
+            return entry.version
+
+        known = self._versions.get(name)
+        if known is None or known[:2] != (stat.st_size, stat.st_mtime_ns):
+            known = self._versions[name] = (stat.st_size, stat.st_mtime_ns, file_version(path))
+        return known[2]
+
+    def info(self):
+        """
+        Version and load timestamp of every loaded model.
+        """
+
+        return {name: entry.info() for name, entry in self._models.items()}
+
+
+registry = ModelRegistry()
+
+
+def get_model(name):
+    return registry.get(name)
@@ -0,0 +1,181 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from core.utils import get_config
+from exploration.cache import source_path, stat_fingerprint
+from exploration.charts import IMAGE_FORMATS
+from exploration.metrics import stage
+from exploration.serving import offload, render_executor
+
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """
+    In-memory LRU cache of rendered images, bounded by the total size of the cached images in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, content):
+        entry = (content, time.time())
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key)[0])
+            if len(content) > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                evicted, (evicted_content, created) = self._entries.popitem(last=False)
+                self.size -= len(evicted_content)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+render_cache = RenderCache(get_config('RENDER_CACHE_MAX_BYTES', 64 * 1024 * 1024, cast=int))
+
+
+def dataset_fingerprint(dir_name, filename):
+    """
+    Cheap fingerprint of an input file, changes whenever the file is replaced or appended to.
+    """
+
+    fingerprint = stat_fingerprint(source_path(dir_name, filename))
+    return f"{fingerprint['size']}-{fingerprint['mtime_ns']}"
+
+
+def render_dpi(request, default=100):
+    """
+    Resolution of a rendered plot, ?dpi= between 50 and 300.
+    """
+
+    try:
+        return min(max(int(request.GET.get('dpi', default)), 50), 300)
+    except ValueError:
+        return default
+
+
+def render_format(request):
+    """
+    Format of a rendered plot, ?output=png (default) or svg. Not ?format=, which rest_framework keeps for itself.
+    """
+
+    fmt = request.GET.get('output', 'png')
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown output {fmt}, expected {' or '.join(IMAGE_FORMATS)}")
+    return fmt
+
+
+def render_key(key_parts):
+    """
+    Cache key and ETag of a rendered plot.
+    """
+
+    key = hashlib.sha256(repr(key_parts).encode('utf-8')).hexdigest()
+    return key, f'"{key[:32]}"'
+
+
+def conditional_response(request, etag, entry):
+    """
+    304 response when the client already holds the plot, None otherwise.
+    """
+
+    if etag in [i.strip() for i in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        return not_modified(etag, entry)
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if entry is not None and if_modified_since is not None and int(entry[1]) <= if_modified_since:
+        return not_modified(etag, entry)
+    return None
+
+
+def render_entry(key, name, render, fmt, dpi):
+    start = time.perf_counter()
+    with stage('render'):
+        entry = render_cache.put(key, render(fmt, dpi))
+    logger.info(f"Rendered {name} as {fmt} in {time.perf_counter() - start:.2f}s.")
+    return entry
+
+
+def cached_image_response(request, key_parts, render):
+    """
+    Serve the image rendered by render(fmt, dpi) for key_parts (endpoint, data and model fingerprints),
+    in the format and resolution of the request (?output=png|svg, ?dpi=).
+    The ETag is derived from the key, so a browser revalidating an unchanged plot gets a 304 without any
+    preprocessing or rendering, and repeat loads with a new client are served from the LRU cache.
+    """
+
+    try:
+        fmt, dpi = render_format(request), render_dpi(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    key, etag = render_key(key_parts + (fmt, dpi))
+    entry = render_cache.get(key)
+    response = conditional_response(request, etag, entry)
+    if response is not None:
+        return response
+
+    if entry is None:
+        entry = render_entry(key, key_parts[0], render, fmt, dpi)
+    return image_response(etag, entry, fmt)
+
+
+async def async_cached_image_response(request, key_parts, render):
+    """
+    cached_image_response for the async views: a missing plot is rendered on the render executor,
+    once for all the concurrent requests of the same plot.
+    """
+
+    try:
+        fmt, dpi = render_format(request), render_dpi(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    key, etag = render_key(key_parts + (fmt, dpi))
+    entry = render_cache.get(key)
+    response = conditional_response(request, etag, entry)
+    if response is not None:
+        return response
+
+    if entry is None:
+        entry = await offload(render_executor, ('render', key), render_entry, key, key_parts[0], render, fmt, dpi)
+    return image_response(etag, entry, fmt)
+
+
+def image_response(etag, entry, fmt):
+    response = HttpResponse(entry[0], content_type=IMAGE_FORMATS[fmt])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(entry[1])
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified(etag, entry):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    if entry is not None:
+        response['Last-Modified'] = http_date(entry[1])
+    return response
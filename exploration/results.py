@@ -0,0 +1,203 @@
+import os
+import glob
+import json
+import fcntl
+import shutil
+import logging
+
+import pandas as pd
+
+from core.utils import get_config
+from exploration.cache import artifact_paths, read_metadata, write_metadata
+from exploration.constants import COL_ORDERS, COL_EARNINGS
+from exploration.parallel import RESULT_COLUMNS, iter_scored_shards
+from exploration.registry import registry
+from exploration.utils import customer_series_artifact, forecast_mode, load_customer_series, model_name
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExportInProgress(RuntimeError):
+    """
+    Raised when the results file is already being written by another export (request or command).
+    """
+
+
+class ResultsWriter:
+    """
+    Append-only writer of the per customer predictions, flushed to disk every batch_size rows.
+    csv results go to a single file, parquet results to a directory of part files. A run that completes
+    leaves a <path>.complete marker; without it the next run resumes and skips the customers already written,
+    provided the <path>.run.json sidecar of the run matches (see run_fingerprint).
+    Used as a context manager, it holds <path>.lock for the whole run, so that two exports of any process
+    never write the same results at once.
+    """
+
+    def __init__(self, path, fmt='csv', batch_size=10000):
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown results format {fmt}, expected csv or parquet")
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.marker = path + '.complete'
+        self.sidecar = path + '.run.json'
+        self.written = 0
+        self._buffer = []
+        self._buffered = 0
+        self._lock_file = None
+
+    def __enter__(self):
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise ExportInProgress(f"{self.path} is being written by another export, try again later")
+        self._lock_file = lock_file
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock_file.close()
+        self._lock_file = None
+        return False
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    def scored_ids(self):
+        """
+        Customer ids already written by an interrupted run.
+        """
+
+        if self.fmt == 'csv':
+            if not os.path.exists(self.path):
+                return set()
+            return set(pd.read_csv(self.path, usecols=['customer_id'], dtype={'customer_id': str})['customer_id'])
+
+        import pyarrow.parquet as pq
+        return set(customer_id for part in self._parts()
+                   for customer_id in pq.read_table(part, columns=['customer_id']).column(0).to_pylist())
+
+    def start(self, resume=True, run=None):
+        """
+        Open a run: resume an interrupted one, or start from scratch after a completed run (or when resume is False).
+        run describes what the results depend on (see run_fingerprint); an interrupted run is only resumed when it was
+        written with the same columns and run, the results of any other run (or without a sidecar) are discarded.
+        Returns the customer ids to skip.
+        """
+
+        run = dict(run or {}, columns=RESULT_COLUMNS)
+        if resume and not os.path.exists(self.marker):
+            if read_metadata(self.sidecar) == run:
+                scored = self.scored_ids()
+                if scored:
+                    logger.info(f"Resuming {self.path}, {len(scored)} customers already scored.")
+                return scored
+            if os.path.exists(self.path):
+                logger.info(f"Starting {self.path} over, it was written by another run.")
+
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.exists(self.marker):
+            os.remove(self.marker)
+        write_metadata(self.sidecar, run)
+        return set()
+
+    def write(self, results):
+        self._buffer.append(results[RESULT_COLUMNS])
+        self._buffered += len(results)
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        batch = pd.concat(self._buffer, ignore_index=True)
+        batch['customer_id'] = batch['customer_id'].astype(str)
+
+        if self.fmt == 'csv':
+            header = not os.path.exists(self.path)
+            with open(self.path, 'a', newline='') as f:
+                batch.to_csv(f, header=header, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            os.makedirs(self.path, exist_ok=True)
+            part = os.path.join(self.path, f'part-{len(self._parts()):05d}.parquet')
+            pq.write_table(pa.Table.from_pandas(batch, preserve_index=False), part + '.tmp')
+            os.replace(part + '.tmp', part)
+
+        self.written += len(batch)
+        self._buffer, self._buffered = [], 0
+        logger.info(f"{self.written} predictions flushed to {self.path}.")
+
+    def complete(self):
+        self.flush()
+        open(self.marker, 'w').close()
+
+
+def results_path(fmt):
+    """
+    Default location of the exported predictions for a format.
+    """
+
+    return 'results.csv' if fmt == 'csv' else 'results.parquet'
+
+
+def run_fingerprint(dir_name, filename):
+    """
+    What the predictions of all the customers of a file depend on: the versions of the models, the forecast settings
+    and the content digest of the per customer series. Call after load_customer_series, which brings the series up to date.
+    """
+
+    path, name, _ = customer_series_artifact(dir_name, filename, COL_ORDERS, 'count')
+    meta = read_metadata(artifact_paths(path, name, partitioned=True)[1]) or {}
+    return {
+        'models': {model_name(col): registry.version(model_name(col)) for col in (COL_ORDERS, COL_EARNINGS)},
+        'num_prediction': get_config('NUM_PREDICTION', cast=int),
+        'mode': forecast_mode(),
+        'dataset': meta.get('sha256'),
+    }
+
+
+def export_predictions(dir_name, filename, path=None, fmt=None, resume=True, workers=None, shards=None):
+    """
+    Score all the customers of a file and append their predictions to the results file as the shards complete.
+    The format (csv or parquet) and the flush batch size are configurable in .env through RESULTS_FORMAT and RESULTS_BATCH_SIZE.
+    """
+
+    fmt = fmt or get_config('RESULTS_FORMAT', 'csv')
+    with ResultsWriter(path or results_path(fmt), fmt, get_config('RESULTS_BATCH_SIZE', 10000, cast=int)) as writer:
+        customer_ids = load_customer_series(dir_name, filename, COL_ORDERS, 'count').customer_ids
+        scored = writer.start(resume, run_fingerprint(dir_name, filename))
+
+        remaining = [i for i in customer_ids if str(i) not in scored]
+
+        for shard, results in iter_scored_shards(dir_name, filename, remaining, workers=workers, shards=shards):
+            writer.write(results)
+        writer.complete()
+
+    logger.info(f"Predictions exported to {writer.path}: {writer.written} scored now, {len(scored)} resumed.")
+    return writer.path, writer.written, len(scored)
+
+
+def stream_predictions(dir_name, filename, fmt='csv'):
+    """
+    Generator of the predictions of all the customers of a file as csv or ndjson text, one chunk per scored shard.
+    """
+
+    if fmt == 'csv':
+        yield ','.join(RESULT_COLUMNS) + '\n'
+
+    for shard, results in iter_scored_shards(dir_name, filename):
+        results = results[RESULT_COLUMNS]
+        if fmt == 'csv':
+            yield results.to_csv(header=False, index=False)
+        else:
+            yield ''.join(json.dumps(row) + '\n' for row in results.astype({'orders_predictions': int}).to_dict(orient='records'))
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from exploration.constants import LOOKBACK
+
+
+class CustomerSeriesStore:
+    """
+    Daily series of every customer in a compressed sparse row layout.
+    Row i holds the days with orders of customer_ids[i]: day_offsets[indptr[i]:indptr[i+1]] (int32 days since start_date)
+    and the matching values. Days without orders are implicit zeros, so memory grows with the number of orders
+    and not with customers x days.
+    """
+
+    def __init__(self, start_date, n_days, customer_ids, indptr, day_offsets, values):
+        self.start_date = pd.Timestamp(start_date)
+        self.n_days = int(n_days)
+        self.customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.day_offsets = np.asarray(day_offsets, dtype=np.int32)
+        self.values = np.asarray(values, dtype=np.float64)
+        self._rows = {customer_id: row for row, customer_id in enumerate(self.customer_ids.tolist())}
+
+        # min/max of every dense series, as seen by the MinMaxScaler, zeros included when a customer skipped a day
+        counts = np.diff(self.indptr)
+        starts = self.indptr[:-1][counts > 0]
+        self.mins = np.zeros(len(self.customer_ids))
+        self.maxs = np.zeros(len(self.customer_ids))
+        if len(starts):
+            self.mins[counts > 0] = np.minimum.reduceat(self.values, starts)
+            self.maxs[counts > 0] = np.maximum.reduceat(self.values, starts)
+        sparse = counts < self.n_days
+        self.mins[sparse] = np.minimum(self.mins[sparse], 0.0)
+        self.maxs[sparse] = np.maximum(self.maxs[sparse], 0.0)
+
+    @classmethod
+    def from_long(cls, df):
+        """
+        Build the store from a long frame with created_at (day), customer_id and value columns, one row per customer and day.
+        """
+
+        days = pd.to_datetime(df['created_at'])
+        start_date = days.min()
+        n_days = (days.max() - start_date).days + 1
+
+        order = np.lexsort((days.values, df['customer_id'].values))
+        customer_ids = df['customer_id'].values[order]
+        unique_ids, first = np.unique(customer_ids, return_index=True)
+        indptr = np.append(first, len(customer_ids))
+        day_offsets = ((days.values[order] - start_date.to_datetime64()) // np.timedelta64(1, 'D')).astype(np.int32)
+
+        return cls(start_date, n_days, unique_ids, indptr, day_offsets, df['value'].values[order])
+
+    @classmethod
+    def from_orders(cls, df, col, operation_type):
+        """
+        Aggregate the col of the order rows per customer and day with operation_type (e.g. count, sum).
+        """
+
+        return cls.from_long(long_customer_frame(df, col, operation_type))
+
+    def to_long(self):
+        """
+        Long frame representation, inverse of from_long, used to persist the store.
+        """
+
+        return pd.DataFrame({
+            'created_at': self.start_date + pd.to_timedelta(self.day_offsets, unit='D'),
+            'customer_id': np.repeat(self.customer_ids, np.diff(self.indptr)),
+            'value': self.values,
+        })
+
+    @property
+    def last_date(self):
+        return self.start_date + pd.Timedelta(days=self.n_days - 1)
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def __contains__(self, customer_id):
+        return int(customer_id) in self._rows
+
+    def row(self, customer_id):
+        """
+        Row index of a customer, raises KeyError for unknown customers.
+        """
+
+        return self._rows[int(customer_id)]
+
+    def series(self, customer_id):
+        """
+        Dense daily series of one customer, from start_date to last_date.
+        """
+
+        row = self.row(customer_id)
+        dense = np.zeros(self.n_days)
+        dense[self.day_offsets[self.indptr[row]:self.indptr[row + 1]]] = self.values[self.indptr[row]:self.indptr[row + 1]]
+        return dense
+
+    def dense(self, rows):
+        """
+        Dense daily series of the customers at the given row indices, as a (len(rows), n_days) array.
+        """
+
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = np.diff(self.indptr)[rows]
+        starts = np.repeat(self.indptr[rows] - (np.cumsum(counts) - counts), counts)
+        entries = starts + np.arange(counts.sum())
+
+        dense = np.zeros((len(rows), self.n_days))
+        dense[np.repeat(np.arange(len(rows)), counts), self.day_offsets[entries]] = self.values[entries]
+        return dense
+
+    def window(self, customer_id, lookback=LOOKBACK):
+        """
+        Last lookback days of one customer, zero padded for the days without orders.
+        """
+
+        row = self.row(customer_id)
+        begin, end = self.indptr[row], self.indptr[row + 1]
+        first_day = self.n_days - lookback
+        # the days of a row are sorted, only the tail falls in the window
+        begin += np.searchsorted(self.day_offsets[begin:end], first_day)
+
+        window = np.zeros(lookback)
+        window[self.day_offsets[begin:end] - first_day] = self.values[begin:end]
+        return window
+
+    def windows(self, customer_ids=None, lookback=LOOKBACK):
+        """
+        Last lookback days of many customers at once as an (N, lookback) array, all customers by default.
+        A few customers are densified on their own, at a cost proportional to their number rather than to the store.
+        """
+
+        rows = np.arange(len(self)) if customer_ids is None else np.array([self.row(i) for i in customer_ids], dtype=np.int64)
+        if len(rows) * self.n_days < len(self.values) + len(self) * lookback:
+            windows = np.zeros((len(rows), lookback))
+            tail = self.dense(rows)[:, -lookback:]
+            windows[:, lookback - tail.shape[1]:] = tail
+            return windows, self.mins[rows], self.maxs[rows]
+
+        first_day = self.n_days - lookback
+        in_window = self.day_offsets >= first_day
+        entry_rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))[in_window]
+
+        windows = np.zeros((len(self), lookback))
+        windows[entry_rows, self.day_offsets[in_window] - first_day] = self.values[in_window]
+        return windows[rows], self.mins[rows], self.maxs[rows]
+
+    def minmax(self, customer_id):
+        """
+        Minimum and maximum of the dense series of one customer, used to scale its window.
+        """
+
+        row = self.row(customer_id)
+        return self.mins[row], self.maxs[row]
+
+    def to_frame(self):
+        """
+        Dense date x customer frame, in the same layout as preprocess_per_customer_data.
+        """
+
+        dense = np.zeros((self.n_days, len(self)))
+        columns = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        dense[self.day_offsets, columns] = self.values
+
+        output = pd.DataFrame(dense, columns=[str(i) for i in self.customer_ids])
+        output.insert(0, 'created_at', pd.date_range(self.start_date, periods=self.n_days).strftime('%Y-%m-%d'))
+        return output
+
+
+def long_customer_frame(df, col, operation_type):
+    """
+    One row per customer and day with orders, aggregating col with operation_type.
+    """
+
+    days = df['created_at'].astype(str).str.split(' |T', n=1, regex=True).str[0]
+    output = df.groupby([days.rename('created_at'), df['customer_id']])[col].agg(operation_type)
+    output = output.rename('value').reset_index()
+    output['created_at'] = pd.to_datetime(output['created_at'], format='%Y-%m-%d')
+    output['value'] = output['value'].astype('float64')
+    return output
+
+
+def add_long_frames(df, delta):
+    """
+    Add the values of the long frame delta to df, per customer and day. Customer days missing from df are appended.
+    """
+
+    keys = ['created_at', 'customer_id']
+    df = df.astype({'created_at': 'datetime64[ns]'})
+    delta = delta.astype({'created_at': 'datetime64[ns]'})
+
+    position = pd.MultiIndex.from_frame(df[keys]).get_indexer(pd.MultiIndex.from_frame(delta[keys]))
+    found = position >= 0
+    values = df['value'].to_numpy(dtype=np.float64, copy=True)
+    values[position[found]] += delta['value'].to_numpy(dtype=np.float64)[found]
+
+    return pd.concat([df.assign(value=values), delta.loc[~found]], ignore_index=True)
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.http import JsonResponse
+
+from core.utils import get_config
+
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """
+    Raised when an executor queue is full, served as a 503 with a Retry-After header.
+    """
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded queue: at most workers tasks run and queue_size wait, further submissions
+    raise Overloaded instead of piling up. Tasks run in the context of the submitting request,
+    so their stages show up in its Server-Timing header.
+    """
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise Overloaded(f"The {self.name} queue is full, try again later")
+
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(context.run, function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+
+class SingleFlight:
+    """
+    Coalesce identical calls: while a computation for a key is running, callers with the same key get its future
+    instead of starting another one. Futures are thread safe, so this holds across event loops and WSGI threads.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, submit):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future
+            future = submit()
+            self._calls[key] = future
+
+        future.add_done_callback(lambda future: self._forget(key, future))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+
+# Preprocessing and inference run on SERVING_THREADS threads (tensorflow and pandas release the GIL in their kernels),
+# rendering on RENDER_THREADS threads, each chart having its own figure
+inference_executor = BoundedExecutor('inference', get_config('SERVING_THREADS', 4, cast=int),
+                                     get_config('SERVING_QUEUE', 16, cast=int))
+render_executor = BoundedExecutor('render', get_config('RENDER_THREADS', 2, cast=int), get_config('SERVING_QUEUE', 16, cast=int))
+# Streamed responses hold a thread for their whole length, at most STREAM_THREADS of them at once
+stream_executor = BoundedExecutor('stream', get_config('STREAM_THREADS', 2, cast=int), 0)
+
+single_flight = SingleFlight()
+
+
+async def offload(executor, key, function, *args):
+    """
+    Run function(*args) on an executor without blocking the event loop, sharing the computation with
+    the concurrent requests of the same key. A client going away does not cancel it for the others.
+    """
+
+    future = single_flight.submit(key, lambda: executor.submit(function, *args))
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def offload_stream(executor, iterator, start_timeout=60):
+    """
+    Async iterator over a blocking iterator run on an executor, for StreamingHttpResponse under ASGI: each item is sent
+    as soon as it is produced instead of the whole iterator being consumed first. The iterator is submitted here, so that
+    a full executor raises Overloaded before the response starts, and it is stopped when the client goes away
+    or when the response is not read within start_timeout seconds.
+    """
+
+    # The loop reading the response is only known once it starts, under WSGI it is not the loop of the view
+    channel = {}
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def send(kind, item):
+        if stopped.is_set() or not started.wait(start_timeout):
+            stopped.set()
+            return
+        try:
+            channel['loop'].call_soon_threadsafe(channel['queue'].put_nowait, (kind, item))
+        except RuntimeError:
+            # The reading loop closed, the client went away
+            stopped.set()
+
+    def produce():
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    break
+                send('item', item)
+        except Exception as e:
+            logger.exception("Streamed response failed.")
+            send('error', e)
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            send('done', None)
+
+    executor.submit(produce)
+
+    async def items():
+        channel['loop'], channel['queue'] = asyncio.get_running_loop(), asyncio.Queue()
+        started.set()
+        try:
+            while True:
+                kind, item = await channel['queue'].get()
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+    return items()
+
+
+def overloaded_response(error):
+    response = JsonResponse({'error': str(error)}, status=503)
+    response['Retry-After'] = str(get_config('SERVING_RETRY_AFTER', 5, cast=int))
+    return response
+
+
+def async_api_view(methods):
+    """
+    Decorator of the async views: restricts the http methods like rest_framework's api_view, exempts them from csrf
+    (api_view does the same) and turns Overloaded into a 503.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                return await view(request, *args, **kwargs)
+            except Overloaded as e:
+                logger.warning(f"{request.path} rejected: {e}")
+                return overloaded_response(e)
+
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import logging
+import subprocess
+
+from core.utils import get_config
+from exploration.constants import DIR_NAME, FILENAME, COL_ORDERS, COL_EARNINGS, SERIES_OPERATIONS
+
+
+logger = logging.getLogger(__name__)
+
+# Dependencies that only some code paths need, and that should not be imported when a worker or a command starts
+HEAVY_MODULES = ('tensorflow', 'keras', 'sklearn', 'matplotlib', 'h5py')
+
+# Steps of warm_up, WARMUP in .env selects them
+WARMUP_STEPS = ('models', 'datasets', 'customers', 'charts')
+
+
+def import_profile(module):
+    """
+    Import time of module after django.setup(), measured with python -X importtime in a fresh interpreter.
+    Returns the total time, every module imported with its own and cumulative time in milliseconds and its depth
+    in the import tree, and the heavy dependencies imported on the way.
+    """
+
+    code = f'import django; django.setup(); import {module}'
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, env=env)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed: {process.stderr.strip().splitlines()[-1]}")
+
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+        })
+
+    imported = {i['module'] for i in modules}
+    return {
+        'module': module,
+        'seconds': round(elapsed, 3),
+        'modules': modules,
+        'heavy': [name for name in HEAVY_MODULES if name in imported],
+    }
+
+
+def warm_up(steps=None):
+    """
+    Load what the first requests of a worker would otherwise load: the served models (and tensorflow with them),
+    the cached daily aggregate, the per customer series and the chart backend. steps defaults to WARMUP in .env,
+    a comma separated list of WARMUP_STEPS. A failing step is logged and skipped, it never stops the worker.
+    Returns the seconds spent per step.
+    """
+
+    from exploration.utils import load_customer_series, model_name, preprocess_all_data
+    from exploration.registry import registry
+    from exploration.precompute import CUSTOMER_FORECASTS
+
+    if steps is None:
+        steps = [i.strip() for i in get_config('WARMUP', 'models,datasets,charts').split(',') if i.strip()]
+
+    def models():
+        for col in (COL_ORDERS, COL_EARNINGS):
+            registry.get(model_name(col))
+
+    def datasets():
+        preprocess_all_data(DIR_NAME, FILENAME)
+
+    def customers():
+        for source, col in CUSTOMER_FORECASTS:
+            load_customer_series(DIR_NAME, source, col, SERIES_OPERATIONS[col])
+
+    def charts():
+        from exploration.charts import image_bytes, new_axes
+        image_bytes(new_axes()[0])
+
+    functions = {'models': models, 'datasets': datasets, 'customers': customers, 'charts': charts}
+    timings = {}
+    for name in steps:
+        if name not in functions:
+            logger.warning(f"Unknown warm-up step {name}, expected one of {', '.join(WARMUP_STEPS)}")
+            continue
+
+        start = time.perf_counter()
+        try:
+            functions[name]()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - start, 3)
+
+    logger.info(f"Worker {os.getpid()} warmed up in {sum(timings.values()):.2f}s: {timings}")
+    return timings
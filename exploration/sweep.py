@@ -0,0 +1,145 @@
+import time
+import random
+import logging
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from core.utils import get_config
+from exploration import workers
+from exploration.constants import DIR_NAME, FILENAME
+from exploration.workers import init_sweep_worker
+
+
+logger = logging.getLogger(__name__)
+
+# Hyperparameters of a trial, in the order of the leaderboard columns
+SWEEP_PARAMETERS = ['neurons', 'epochs', 'batch_size', 'lookback', 'prediction_horizon']
+
+LEADERBOARD_COLUMNS = ['trial'] + SWEEP_PARAMETERS + ['epochs_run', 'stopped', 'val_loss', 'mape', 'fit_seconds', 'latency_ms']
+
+
+def sweep_trials(space, search='grid', trials=None, seed=0):
+    """
+    Configurations to train: every combination of the values of space (a dict of lists) for a grid search,
+    or trials combinations drawn at random without replacement for a random search.
+    """
+
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    if search == 'random':
+        grid = random.Random(seed).sample(grid, min(trials or len(grid), len(grid)))
+    elif trials:
+        grid = grid[:trials]
+    return grid
+
+
+def pruning_callback(best, warmup, factor):
+    """
+    Keras callback stopping a trial whose validation loss, after warmup epochs, is still factor times worse
+    than the best final validation loss of the trials finished so far (shared by all the sweep processes).
+    """
+
+    from tensorflow.keras.callbacks import Callback
+
+    class Pruning(Callback):
+        pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            val_loss = (logs or {}).get('val_loss')
+            if epoch + 1 >= warmup and val_loss is not None and val_loss > factor * best.value:
+                self.pruned = True
+                self.model.stop_training = True
+
+    return Pruning()
+
+
+def run_trial(trial, config):
+    """
+    Train and test one configuration like prepare_model, on the daily series shared by the sweep process,
+    without saving the model. Returns a leaderboard row.
+    """
+
+    from sklearn.metrics import mean_absolute_percentage_error
+    from sklearn.preprocessing import MinMaxScaler
+    from tensorflow.keras.callbacks import EarlyStopping
+    from exploration.utils import build_model, sliding_windows
+
+    lookback, horizon = config['lookback'], config['prediction_horizon']
+    scaler = MinMaxScaler(feature_range=(0,1))
+    data = scaler.fit_transform(workers.sweep_data.reshape((-1, 1)))
+    train_size = int(len(data) * 0.7)
+    X_train, Y_train = sliding_windows(data[:train_size], lookback, horizon)
+    X_test, Y_test = sliding_windows(data[train_size:], lookback, horizon)
+    if not len(X_train) or not len(X_test):
+        raise ValueError(f"Not enough days for lookback {lookback} and horizon {horizon}")
+
+    model = build_model(config['neurons'], lookback, horizon)
+    early_stopping = EarlyStopping(monitor='val_loss', patience=get_config('SWEEP_PATIENCE', 20, cast=int),
+                                   restore_best_weights=True)
+    pruning = pruning_callback(workers.sweep_best, max(1, int(config['epochs'] * get_config('SWEEP_WARMUP', 0.25, cast=float))),
+                               get_config('SWEEP_PRUNE_FACTOR', 3.0, cast=float))
+
+    start = time.perf_counter()
+    # The last 20% of the training windows validate the trial, in time order
+    history = model.fit(X_train, Y_train, epochs=config['epochs'], batch_size=config['batch_size'],
+                        validation_split=0.2, shuffle=False, verbose=0, callbacks=[early_stopping, pruning])
+    fit_time = time.perf_counter() - start
+
+    val_loss = float(min(history.history['val_loss']))
+    if not pruning.pruned:
+        with workers.sweep_best.get_lock():
+            workers.sweep_best.value = min(workers.sweep_best.value, val_loss)
+
+    test_predict = scaler.inverse_transform(model.predict(X_test, verbose=0))
+    mape = float(mean_absolute_percentage_error(scaler.inverse_transform(Y_test), test_predict))
+
+    # Latency of one forecast step: a single window through the model
+    x = np.ascontiguousarray(X_test[:1], dtype=np.float32)
+    model(x, training=False)
+    latencies = []
+    for i in range(20):
+        begin = time.perf_counter()
+        model(x, training=False)
+        latencies.append(time.perf_counter() - begin)
+
+    stopped = 'pruned' if pruning.pruned else ('early' if early_stopping.stopped_epoch else '')
+    row = dict(trial=trial, **config, epochs_run=len(history.history['loss']), stopped=stopped, val_loss=val_loss,
+               mape=mape, fit_seconds=round(fit_time, 2), latency_ms=round(1000 * float(np.median(latencies)), 3))
+    logger.info(f"Sweep trial {trial} {config}: MAPE {mape:.4f}, {row['epochs_run']} epochs {stopped}.")
+    return row
+
+
+def run_sweep(col, configs, workers_count=None, dir_name=DIR_NAME, filename=FILENAME):
+    """
+    Train the configurations concurrently on a pool of spawned processes, one thread each, and return
+    the leaderboard sorted by MAPE, completed trials first. The cached daily dataset is preprocessed once and shared by all the trials.
+    """
+
+    from exploration.utils import preprocess_all_data
+
+    data = preprocess_all_data(dir_name, filename)[col].to_numpy(dtype=np.float64)
+    best = multiprocessing.get_context('spawn').Value('d', float('inf'))
+    workers_count = workers_count or get_config('SWEEP_WORKERS', 0, cast=int) or multiprocessing.cpu_count()
+    logger.info(f"Sweep of {len(configs)} configurations for {col} on {workers_count} processes.")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers_count,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_sweep_worker, initargs=(data, best)) as pool:
+        futures = {pool.submit(run_trial, trial, config): (trial, config) for trial, config in enumerate(configs)}
+        for future in as_completed(futures):
+            trial, config = futures[future]
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                logger.exception(f"Sweep trial {trial} {config} failed.")
+                rows.append(dict(trial=trial, **config, stopped=f'failed: {e}'))
+
+    # Trials run to completion first, pruned and failed trials are only partially trained
+    leaderboard = pd.DataFrame(rows, columns=LEADERBOARD_COLUMNS)
+    leaderboard['complete'] = leaderboard['stopped'].isin(['', 'early'])
+    leaderboard = leaderboard.sort_values(['complete', 'mape', 'trial'], ascending=[False, True, True], na_position='last')
+    return leaderboard.drop(columns='complete').reset_index(drop=True)
@@ -1,3 +1,307 @@
-from django.test import TestCase
+import os
+import asyncio
+import tempfile
+import threading
+import importlib.util
+from unittest import mock, skipUnless
 
-# Create your unit tests here.
+import numpy as np
+import pandas as pd
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase, tag
+
+from exploration.benchmarks import synthetic_orders
+from exploration.charts import downsample, lttb
+from exploration.constants import LOOKBACK
+from exploration.forecast_cache import memoized_forecasts
+from exploration.ingest import ingest_batch, ingest_orders, read_batch
+from exploration.lstm_numpy import NumpyLSTMModel
+from exploration.parallel import RESULT_COLUMNS
+from exploration.results import ResultsWriter
+from exploration.series_store import CustomerSeriesStore
+from exploration.serving import BoundedExecutor, async_api_view, offload
+from exploration.utils import (build_model, customer_series_frame, find_missing_dates, forecast_batch, load_data,
+                               per_customer_frame, preprocess_all_data, preprocess_all_data_streaming, preprocess_frame,
+                               sliding_windows)
+
+# Tests are tagged with the request they cover, e.g. python3 manage.py test exploration --tag user-005
+has_tensorflow = importlib.util.find_spec('tensorflow') is not None
+
+
+class DatasetTestCase(SimpleTestCase):
+    """
+    Input files and cached artifacts in a temporary directory, with synthetic orders instead of the Git LFS datasets.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir_name = tmp.name
+        environ = mock.patch.dict(os.environ, {'CACHE_DIR': os.path.join(tmp.name, 'cache'), 'PREPROCESS_CHUNKSIZE': '0'})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        df = synthetic_orders(3000, 40, 60, seed=1)
+        # Duplicated rows, dropped by the preprocessing, and rows differing only by platform, which are kept
+        self.orders = pd.concat([df, df.iloc[:25], df.iloc[25:40].assign(platform='other')], ignore_index=True)
+
+    def write(self, filename, df):
+        df.to_csv(os.path.join(self.dir_name, filename), index=False)
+
+
+@tag('user-002')
+class PreprocessTests(DatasetTestCase):
+
+    def test_streaming_equals_in_memory(self):
+        self.write('orders.csv', self.orders)
+        expected = preprocess_frame(load_data(self.dir_name, 'orders.csv'))
+
+        for chunksize in (97, 1000, 10 ** 6):
+            with self.subTest(chunksize=chunksize):
+                pd.testing.assert_frame_equal(preprocess_all_data_streaming(self.dir_name, 'orders.csv', chunksize), expected)
+
+    def test_full_row_duplicates_only(self):
+        self.write('orders.csv', self.orders)
+        returning = self.orders['visitor_type'].str.contains('returning', case=False)
+        expected = int(returning.sum()) - int(returning.iloc[3000:3025].sum())
+        self.assertEqual(int(preprocess_all_data(self.dir_name, 'orders.csv')['order_id'].sum()), expected)
+
+
+@tag('user-014')
+class IngestTests(DatasetTestCase):
+
+    def test_ingest_equals_full_rebuild(self):
+        head, tail = self.orders.iloc[:2500], self.orders.iloc[2500:]
+        self.write('orders.csv', head)
+        preprocess_all_data(self.dir_name, 'orders.csv')
+
+        summary = ingest_orders(self.dir_name, 'orders.csv', read_batch(tail.to_csv(index=False)))
+        self.assertEqual(summary['rows'], len(tail))
+
+        self.write('rebuilt.csv', self.orders)
+        pd.testing.assert_frame_equal(preprocess_all_data(self.dir_name, 'orders.csv'),
+                                      preprocess_all_data(self.dir_name, 'rebuilt.csv'))
+        for col, operation_type in (('order_id', 'count'), ('total_order_value', 'sum')):
+            ingested, rebuilt = (customer_series_frame(self.dir_name, filename, col, operation_type)
+                                 .sort_values(['created_at', 'customer_id'], ignore_index=True)
+                                 for filename in ('orders.csv', 'rebuilt.csv'))
+            pd.testing.assert_frame_equal(ingested, rebuilt, check_dtype=False)
+
+    def test_ndjson_batch(self):
+        batch = read_batch('{"order_id": 1, "platform": null}\n{"order_id": 2, "platform": "ios"}\n', 'ndjson')
+        self.assertEqual(batch.to_dict('list'), {'order_id': ['1', '2'], 'platform': ['', 'ios']})
+
+    def test_batch_lands_in_all_files_or_none(self):
+        head, tail = self.orders.iloc[:2500], self.orders.iloc[2500:]
+        self.write('bq-results.csv', head)
+        top = head[head['customer_id'].isin(head['customer_id'].unique()[:5])]
+        self.write('top_10_customers_orders.csv', top[['created_at', 'order_id', 'total_order_value', 'customer_id']])
+        paths = [os.path.join(self.dir_name, i) for i in ('bq-results.csv', 'top_10_customers_orders.csv')]
+        sizes = [os.path.getsize(i) for i in paths]
+
+        with self.assertRaises(ValueError):
+            ingest_batch(self.dir_name, read_batch(tail.drop(columns='platform').to_csv(index=False)))
+        self.assertEqual([os.path.getsize(i) for i in paths], sizes)
+
+        summary = ingest_batch(self.dir_name, read_batch(tail.to_csv(index=False)))
+        self.assertEqual(summary['files'], {'top_10_customers_orders.csv': int(tail['customer_id'].isin(top['customer_id']).sum())})
+        self.assertEqual(list(pd.read_csv(paths[1]).columns), ['created_at', 'order_id', 'total_order_value', 'customer_id'])
+
+
+@tag('user-007')
+@skipUnless(has_tensorflow, 'tensorflow is not installed')
+class NumpyLSTMTests(SimpleTestCase):
+
+    def test_matches_keras(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'model_order_id.h5')
+        keras_model = build_model(8, LOOKBACK, 3)
+        keras_model.save(path)
+        numpy_model = NumpyLSTMModel.from_h5(path)
+
+        x = np.random.default_rng(0).random((64, LOOKBACK, 1))
+        np.testing.assert_allclose(numpy_model.predict(x), keras_model.predict(x, verbose=0), rtol=1e-4, atol=1e-5)
+
+
+def per_step_forecast(model, series, num_prediction):
+    """
+    The forecast of one series as predict_new_values computed it before batching, one model.predict per step.
+    """
+
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler = MinMaxScaler(feature_range=(0,1))
+    prediction_list = scaler.fit_transform(series.reshape((-1, 1)))[-LOOKBACK:]
+    for _ in range(num_prediction):
+        x = prediction_list[-LOOKBACK:].reshape((1, LOOKBACK, 1))
+        prediction_list = np.append(prediction_list, model.predict(x, verbose=0)[0][0])
+    return scaler.inverse_transform(prediction_list[LOOKBACK-1:].reshape((-1, 1)))[:, 0]
+
+
+@tag('user-005')
+@skipUnless(has_tensorflow, 'tensorflow is not installed')
+class ForecastBatchTests(SimpleTestCase):
+
+    def test_matches_per_step_predict(self):
+        model = build_model(8, LOOKBACK, 1)
+        series = np.random.default_rng(0).gamma(2.0, 5.0, (5, 40))
+        series[1] = 3.0
+
+        predictions = forecast_batch(model, series[:, -LOOKBACK:], series.min(axis=1), series.max(axis=1), 10)
+        expected = np.array([per_step_forecast(model, i, 10) for i in series])
+        np.testing.assert_allclose(predictions, expected, rtol=1e-4, atol=1e-4)
+
+
+@tag('user-004')
+class SeriesStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.orders = synthetic_orders(3000, 40, 60, seed=2)
+        df = self.orders.copy()
+        self.dense = per_customer_frame(df, 'total_order_value', 'sum', find_missing_dates(df))
+        self.store = CustomerSeriesStore.from_orders(self.orders, 'total_order_value', 'sum')
+
+    def test_to_frame_equals_dense_pivot(self):
+        pd.testing.assert_frame_equal(self.store.to_frame(), self.dense)
+
+    def test_windows_equal_dense_pivot(self):
+        # A few customers are densified on their own, all of them are read from the sparse layout
+        for customer_ids in ([self.store.customer_ids[3], self.store.customer_ids[0]], None):
+            with self.subTest(customers=customer_ids):
+                windows, data_min, data_max = self.store.windows(customer_ids, LOOKBACK)
+                columns = [str(i) for i in (self.store.customer_ids if customer_ids is None else customer_ids)]
+                dense = self.dense[columns].to_numpy()
+                np.testing.assert_array_equal(windows, dense[-LOOKBACK:].T)
+                np.testing.assert_array_equal(data_min, dense.min(axis=0))
+                np.testing.assert_array_equal(data_max, dense.max(axis=0))
+
+
+@tag('user-015')
+class SlidingWindowsTests(SimpleTestCase):
+
+    def test_legacy_equals_loop(self):
+        data = np.random.default_rng(0).random((50, 1))
+        for prediction_horizon in (1, LOOKBACK):
+            with self.subTest(prediction_horizon=prediction_horizon):
+                # The loop of prepare_lstm_data before it was vectorized
+                X, Y = [], []
+                for i in range(LOOKBACK, len(data) - LOOKBACK):
+                    X.append(data[i-LOOKBACK : i, 0])
+                    Y.append(data[i : i + prediction_horizon, 0])
+
+                windows, targets = sliding_windows(data, LOOKBACK, prediction_horizon, legacy=True)
+                np.testing.assert_array_equal(windows[:, :, 0], np.array(X))
+                np.testing.assert_array_equal(targets, np.array(Y))
+
+
+@tag('user-013')
+class ForecastCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        caches['forecasts'].clear()
+        self.addCleanup(caches['forecasts'].clear)
+        self.computed = []
+        self.windows = np.random.default_rng(0).random((3, LOOKBACK))
+
+    def forecasts(self, windows, model_version='v1', last_date='2019-02-28'):
+        def compute(windows, data_min, data_max):
+            self.computed.append(len(windows))
+            return np.repeat(windows[:, -1:], 4, axis=1)
+
+        return memoized_forecasts('order_id', model_version, [1, 2, 3], windows, windows.min(axis=1), windows.max(axis=1),
+                                  pd.Timestamp(last_date), 3, compute)
+
+    def test_invalidation(self):
+        first = self.forecasts(self.windows)
+        np.testing.assert_array_equal(self.forecasts(self.windows), first)
+        self.assertEqual(self.computed, [3])
+
+        # A retrained model
+        self.forecasts(self.windows, model_version='v2')
+        self.assertEqual(self.computed, [3, 3])
+
+        # New data for one customer, then a new day for all of them
+        windows = self.windows.copy()
+        windows[1, -1] += 1
+        self.assertEqual(self.forecasts(windows)[1, 0], windows[1, -1])
+        self.forecasts(windows, last_date='2019-03-01')
+        self.assertEqual(self.computed, [3, 3, 1, 3])
+
+
+@tag('user-010')
+class ResultsResumeTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'results.csv')
+        self.run = {'models': {'order_id': 'a', 'total_order_value': 'b'}, 'num_prediction': 17, 'dataset': 'c'}
+
+    def interrupted_run(self, run):
+        with ResultsWriter(self.path, batch_size=1) as writer:
+            writer.start(True, run)
+            writer.write(pd.DataFrame({'customer_id': ['1', '2'], 'orders_predictions': [3, 4], 'values_predictions': [5.0, 6.0]}))
+
+    def test_resume_same_run(self):
+        self.interrupted_run(self.run)
+        with ResultsWriter(self.path) as writer:
+            self.assertEqual(writer.start(True, self.run), {'1', '2'})
+            writer.complete()
+        with ResultsWriter(self.path) as writer:
+            self.assertEqual(writer.start(True, self.run), set())
+
+    def test_restart_other_run(self):
+        self.interrupted_run(self.run)
+        with ResultsWriter(self.path) as writer:
+            self.assertEqual(writer.start(True, dict(self.run, dataset='d')), set())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_restart_legacy_results(self):
+        # results.csv of the original export, with an index column and without a run sidecar
+        pd.DataFrame({'customer_id': ['1'], 'orders_predictions': [3], 'values_predictions': [5.0]}).to_csv(self.path)
+        with ResultsWriter(self.path) as writer:
+            self.assertEqual(writer.start(True, self.run), set())
+            writer.write(pd.DataFrame({'customer_id': ['2'], 'orders_predictions': [4], 'values_predictions': [6.0]}))
+            writer.complete()
+        self.assertEqual(list(pd.read_csv(self.path).columns), RESULT_COLUMNS)
+
+
+@tag('user-024')
+class ChartTests(SimpleTestCase):
+
+    def test_lttb_keeps_endpoints_and_count(self):
+        y = np.random.default_rng(0).normal(size=1000)
+        keep = lttb(np.arange(1000), y, 100)
+
+        self.assertEqual(len(keep), 100)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_downsample_dates(self):
+        x = pd.date_range('2019-01-01', periods=500).to_numpy()
+        dates, values = downsample(x, np.arange(500.0), 50)
+
+        self.assertEqual(len(dates), 50)
+        self.assertEqual((dates[0], dates[-1]), (x[0], x[-1]))
+
+    def test_short_series_unchanged(self):
+        self.assertEqual(list(lttb(np.arange(10), np.arange(10), 100)), list(range(10)))
+
+
+@tag('user-023')
+class ServingTests(SimpleTestCase):
+
+    def test_full_executor_returns_503(self):
+        executor = BoundedExecutor('test', 1, 0)
+        release = threading.Event()
+        executor.submit(release.wait)
+        self.addCleanup(release.set)
+
+        @async_api_view(['GET'])
+        async def view(request):
+            return await offload(executor, ('test', 'overloaded'), lambda: None)
+
+        response = asyncio.run(view(RequestFactory().get('/')))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
@@ -5,9 +5,19 @@ urlpatterns = [
     path('data_viewer/', views.data_viewer, name = 'data_viewer'),
     path('data_trainer_orders/', views.data_trainer_orders, name = 'data_trainer_orders'),
     path('data_trainer_earnings/', views.data_trainer_earnings, name = 'data_trainer_earnings'),
+    path('training_jobs/<int:job_id>/', views.training_job_status, name = 'training_job_status'),
+    path('training_jobs/<int:job_id>/plot/', views.training_job_plot, name = 'training_job_plot'),
     path('data_predict_orders/', views.data_predict_orders, name = 'data_predict_orders'),
     path('data_predict_earnings/', views.data_predict_earnings, name = 'data_predict_earnings'),
+    path('data_forecast_orders/', views.data_forecast_orders, name = 'data_forecast_orders'),
+    path('data_forecast_earnings/', views.data_forecast_earnings, name = 'data_forecast_earnings'),
     path('data_predict_per_customer/', views.data_predict_per_customer, name = 'data_predict_per_customer'),
-    path('data_predict_per_customer_all_returning_customers/', views.data_predict_per_customer_all_returning_customers, name = 'data_predict_per_customer_all_returning_customers')
+    path('customers/forecast/', views.customer_forecasts_batch, name = 'customer_forecasts'),
+    path('customers/<str:customer_id>/forecast/', views.customer_forecast, name = 'customer_forecast'),
+    path('data_predict_per_customer_all_returning_customers/', views.data_predict_per_customer_all_returning_customers, name = 'data_predict_per_customer_all_returning_customers'),
+    path('data_predict_per_customer_stream/', views.data_predict_per_customer_stream, name = 'data_predict_per_customer_stream'),
+    path('data_ingest_orders/', views.data_ingest_orders, name = 'data_ingest_orders'),
+    path('forecast_freshness/', views.forecast_freshness, name = 'forecast_freshness'),
+    path('model_registry/', views.model_registry, name = 'model_registry')
 
 ]
\ No newline at end of file
@@ -2,20 +2,24 @@ import numpy as np
 import pandas as pd
 import logging
 import os, re
-import datetime
+from collections import defaultdict
 
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import Dense, LSTM
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics import mean_absolute_percentage_error
-import h5py
 from core.utils import get_config
 from exploration.constants import LOOKBACK
+from exploration.cache import cached_frame, source_path, stat_fingerprint
+from exploration.series_store import CustomerSeriesStore, long_customer_frame
+from exploration.registry import registry, get_model
+from exploration.forecast_cache import memoized_forecasts
+from exploration.metrics import stage, timed
 
 
 logger = logging.getLogger(__name__)
 
+# Series stores already built by this worker: (source path, col, operation_type) -> (stat fingerprint, store)
+_stores = {}
 
+
+@timed('load_data', rows=len)
 def load_data(dir_name, filename):
     """
     Read input csv data.
@@ -30,14 +34,24 @@ def find_missing_dates(df):
     If there are missing dates in the dataset, the missing values are imputed.
     """
 
-    df['created_at']=[re.split(' |T',i)[0] for i in df['created_at']]
+    df['created_at'] = df['created_at'].astype(str).str.split(' |T', n=1, regex=True).str[0]
     # get all days from min to max; just in case a day is missing...
-    days = [datetime.datetime.strptime(i, '%Y-%m-%d') for i in set(df['created_at'])]
-    all_days = []
-    for i in range((max(days) - min(days)).days+1):
-        all_days.append(str(min(days) + datetime.timedelta(days=i)).split()[0])
-    return all_days        
+    all_days = pd.date_range(df['created_at'].min(), df['created_at'].max(), freq='D')
+    return all_days.strftime('%Y-%m-%d').tolist()
+
+def per_customer_frame(df, col, operation_type, all_days):
+    """
+    Aggregate col per day and customer with a single groupby, one column per customer and one row per day.
+    Days without orders for a customer are filled with 0.
+    """
+
+    output = df.groupby(['created_at', 'customer_id'])[col].agg(operation_type).unstack('customer_id', fill_value=0.0)
+    output = output.reindex(all_days, fill_value=0.0).astype('float64')
+    output.columns = [str(i) for i in output.columns]
+    output.index.name = 'created_at'
+    return output.reset_index()
 
+@timed('preprocess_per_customer', rows=len)
 def preprocess_per_customer_data(dir_name, filename, col, operation_type):
     """
     Preprocess data regarding the per customer predictions.
@@ -45,48 +59,266 @@ def preprocess_per_customer_data(dir_name, filename, col, operation_type):
 
     df = load_data(dir_name, filename)
     all_days = find_missing_dates(df)
-    
-    output = []
-    # loop on unique customer ids
-    for unique_customer in [str(i) for i in set(df['customer_id'])]:
-        current_customer_data = df[(df.customer_id == int(unique_customer))].groupby('created_at')[col].agg(operation_type).to_dict()
-        # prepare data dict for all days with 0 value and overwrite when you find a non-zero day entry
-        final_customer_data = {i:0.0 for i in all_days}
-        for i,j in current_customer_data.items():
-            if i in final_customer_data:
-                final_customer_data[i] = j
-        # prepare dataframe for current customer
-        final_customer_dataframe = pd.DataFrame.from_dict(final_customer_data, orient='index', columns=[unique_customer])
-        output.append(final_customer_dataframe)
-
-    # join dataframes
-    output = pd.concat([i for i in output], axis=1)
-    output.reset_index(inplace=True)
-    output = output.rename(columns = {'index':'created_at'})
+    output = per_customer_frame(df, col, operation_type, all_days)
 
     logger.info(" Dataframe with unique customers as columns successfully transformed.")
 
-
     return output    
 
-def preprocess_all_data(dir_name, filename):
+def series_artifact(col, operation_type):
     """
-    Preprocess data regarding the whole customer portfolio.
+    Name of the cached long frame of the per customer series of col.
     """
 
-    df = load_data(dir_name, filename)
+    return f'{col}_{operation_type}_returning_series'
+
+def returning_orders(df):
+    """
+    Order rows of the returning visitors without the duplicate rows, the rows preprocess_frame aggregates.
+    Exports without visitor_type (the top customers files) only hold the orders of selected customers and are kept whole.
+    """
+
+    if 'visitor_type' not in df.columns:
+        return df
 
     # Find duplicate rows if any and drop them
-    duplicate = df[df.duplicated()]
-    number_of_dups = len(duplicate)
+    number_of_dups = int(df.duplicated().sum())
     if number_of_dups:
         df = df.drop_duplicates()
         logger.info(f"There are {number_of_dups} duplicate rows for this dataset.")
 
-    # Returning customers
-    # We will only keep in the dataset the customers that have an order history (visitor_type=returning)     
-    df1 = df.dropna(subset=['visitor_type'])
-    df_ret = df1.loc[df1["visitor_type"].str.contains('returning', case=False)]
+    # We will only keep in the dataset the customers that have an order history (visitor_type=returning)
+    df = df.dropna(subset=['visitor_type'])
+    return df.loc[df["visitor_type"].str.contains('returning', case=False)]
+
+def customer_series_artifact(dir_name, filename, col, operation_type):
+    """
+    Source path, name and builder of the cached long frame of the per customer series of col, partitioned by day.
+    Only the returning visitors count, without duplicates, so that the series of a customer adds up
+    to the daily totals the LSTM models are trained on.
+    """
+
+    return (source_path(dir_name, filename), series_artifact(col, operation_type),
+            lambda: long_customer_frame(returning_orders(load_data(dir_name, filename)), col, operation_type))
+
+def customer_series_frame(dir_name, filename, col, operation_type):
+    """
+    Per customer series of col in long format, cached on disk.
+    """
+
+    return cached_frame(*customer_series_artifact(dir_name, filename, col, operation_type), partition='created_at')
+
+def load_customer_series(dir_name, filename, col, operation_type):
+    """
+    Per customer series of col in a compact CustomerSeriesStore, cached on disk in long format.
+    The store is read only and kept by the worker until the input file changes, so looking up a few customers
+    does not rebuild it.
+    """
+
+    path = source_path(dir_name, filename)
+    fingerprint = stat_fingerprint(path)
+    entry = _stores.get((path, col, operation_type))
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1]
+
+    with stage('load_customer_series') as measured:
+        store = CustomerSeriesStore.from_long(customer_series_frame(dir_name, filename, col, operation_type))
+        measured.rows = len(store)
+    _stores[(path, col, operation_type)] = (fingerprint, store)
+
+    logger.info(f" Series of {len(store)} customers successfully loaded.")
+
+    return store
+
+def kahan_sum(values, total=0.0, compensation=0.0):
+    """
+    Sum of the non-missing values continuing from (total, compensation), with the Kahan compensated summation
+    of pandas' groupby sum, value by value in the same order. Chunked and incremental sums of a day therefore give
+    the exact same float as a groupby over the whole file. Returns the new (total, compensation).
+    """
+
+    for value in values.tolist():
+        if value != value:
+            continue
+        y = value - compensation
+        t = total + y
+        compensation = t - total - y
+        if compensation != compensation:
+            # An infinite value, pandas resets the compensation so that the sum stays infinite
+            compensation = 0.0
+        total = t
+    return total, compensation
+
+
+def csv_header(path):
+    with open(path) as f:
+        return f.readline().rstrip('\r\n').split(',')
+
+
+def order_dtypes(header):
+    """
+    Types of the columns of an input csv for the streaming and incremental paths: every column is read as text,
+    so that row hashes do not depend on the types pandas infers for each chunk, and total_order_value as a float
+    parsed as read_csv parses it for preprocess_frame.
+    """
+
+    return dict({col: str for col in header}, total_order_value='float64')
+
+
+class RowHashes:
+    """
+    Set of 64-bit row hashes kept as a few sorted arrays of decreasing sizes, 8 bytes per hash.
+    Adding the hashes of a chunk only merges arrays of similar sizes (like a binary counter), so each hash
+    is merged O(log n) times overall instead of the whole set being sorted again for every chunk.
+    """
+
+    def __init__(self, hashes=None):
+        self._runs = []
+        if hashes is not None and len(hashes):
+            self._runs.append(np.sort(np.asarray(hashes, dtype=np.uint64)))
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def contains(self, hashes):
+        known = np.zeros(len(hashes), dtype=bool)
+        for run in self._runs:
+            position = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            known |= run[position] == hashes
+        return known
+
+    def add(self, hashes):
+        run = np.sort(np.asarray(hashes, dtype=np.uint64))
+        while self._runs and len(self._runs[-1]) <= 2 * len(run):
+            # Two sorted runs, the stable sort (timsort) merges them in linear time
+            run = np.sort(np.concatenate([self._runs.pop(), run]), kind='stable')
+        if len(run):
+            self._runs.append(run)
+
+    def array(self):
+        """
+        All the hashes as one sorted array.
+        """
+
+        if len(self._runs) > 1:
+            self._runs = [np.sort(np.concatenate(self._runs), kind='stable')]
+        return self._runs[0] if self._runs else np.empty(0, dtype=np.uint64)
+
+
+def fold_daily_chunk(chunk, seen, orders, earnings):
+    """
+    Fold a chunk of order rows (read with order_dtypes) into the per day counts and (sum, compensation)
+    of the returning visitors. seen maps each day to the RowHashes of its rows: rows whose hash over all their columns
+    is already in the hashes of their day, or earlier in the chunk, are skipped as duplicates, as preprocess_frame
+    drops full row duplicates, and the others are added to them. Returns the number of duplicates and the index
+    of the rows folded.
+    """
+
+    # Returning customers, duplicates of the other rows are filtered out anyway
+    returning = chunk['visitor_type'].str.contains('returning', case=False).fillna(False).to_numpy(dtype=bool)
+    chunk = chunk.loc[returning]
+
+    hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+    counted = chunk['order_id'].notna().to_numpy()
+    values = chunk['total_order_value'].to_numpy()
+    folded = np.zeros(len(chunk), dtype=bool)
+
+    # Duplicate rows share their day, each day is only checked against its own hashes
+    days = pd.to_datetime(chunk['created_at']).dt.date
+    for day, positions in chunk.groupby(days).indices.items():
+        new = ~seen[day].contains(hashes[positions]) & ~pd.Series(hashes[positions]).duplicated().to_numpy()
+        positions = positions[new]
+        seen[day].add(hashes[positions])
+        folded[positions] = True
+        orders[day] += int(counted[positions].sum())
+        earnings[day] = kahan_sum(values[positions], *earnings.get(day, (0.0, 0.0)))
+
+    return int(len(chunk) - folded.sum() - days.isna().sum()), chunk.index[folded]
+
+
+def scan_daily_data(dir_name, filename, chunksize):
+    """
+    Read the input csv in chunks and fold them into the per day row hashes, counts and (sum, compensation)
+    of the returning visitors. Memory depends on the chunk size and on the number of rows (8 bytes per row hash).
+    """
+
+    seen = defaultdict(RowHashes)
+    number_of_dups = 0
+    orders = defaultdict(int)
+    earnings = {}
+
+    path = os.path.join(os.getcwd(), dir_name, filename)
+    with open(path) as f:
+        for chunk in pd.read_csv(f, chunksize=chunksize, dtype=order_dtypes(csv_header(path))):
+            number_of_dups += fold_daily_chunk(chunk, seen, orders, earnings)[0]
+
+    if number_of_dups:
+        logger.info(f"There are {number_of_dups} duplicate rows for the returning visitors of this dataset.")
+
+    return seen, orders, earnings
+
+
+def daily_frame(orders, earnings):
+    """
+    Dataset of the LSTM model from the orders and earnings of each day, with the weekday-weekend feature.
+    """
+
+    days = sorted(orders)
+    df_lstm = pd.DataFrame({'created_at': days,
+                            'order_id': np.array([orders[i] for i in days], dtype='int64'),
+                            'total_order_value': [earnings[i] for i in days]})
+    df_lstm['weekday'] = df_lstm['created_at'].apply(lambda x: x.weekday()>=5)
+    return df_lstm
+
+
+@timed('preprocess_streaming', rows=len)
+def preprocess_all_data_streaming(dir_name, filename, chunksize):
+    """
+    Preprocess data regarding the whole customer portfolio, reading the input csv in chunks.
+    Each chunk is filtered to the returning visitors and folded into per day counts and sums, so memory depends
+    on the chunk size and not on the size of the file. Duplicates are dropped across chunks with 64-bit hashes
+    of the full rows (8 bytes per returning row), so the result is the one of preprocess_frame.
+    """
+
+    seen, orders, earnings = scan_daily_data(dir_name, filename, chunksize)
+
+    # Calculate orders and earnings per day
+    df_lstm = daily_frame(orders, {day: total for day, (total, compensation) in earnings.items()})
+
+    logger.info(" Input dataframe successfully transformed in chunks.")
+
+    return df_lstm
+
+def preprocess_all_data(dir_name, filename, use_cache=True):
+    """
+    Preprocess data regarding the whole customer portfolio.
+    The daily aggregate is cached on disk and only rebuilt when the input file changes.
+    """
+
+    if use_cache:
+        with stage('daily_cache') as measured:
+            df_lstm = cached_frame(source_path(dir_name, filename), 'daily',
+                                   lambda: preprocess_all_data(dir_name, filename, use_cache=False))
+            measured.rows = len(df_lstm)
+        return df_lstm
+
+    # Bounded memory mode, configurable in .env through PREPROCESS_CHUNKSIZE (0 loads the whole file)
+    chunksize = get_config('PREPROCESS_CHUNKSIZE', 0, cast=int)
+    if chunksize:
+        return preprocess_all_data_streaming(dir_name, filename, chunksize)
+
+    df = load_data(dir_name, filename)
+    with stage('preprocess', rows=len(df)):
+        return preprocess_frame(df)
+
+
+def preprocess_frame(df):
+    """
+    Orders and earnings per day of the returning customers of the raw input data.
+    """
+
+    # Returning customers, without the duplicate rows
+    df_ret = returning_orders(df)
 
     # We will remove these columns as they do not contribute in the features of the prediction problem
     df_minimal = df_ret.drop(columns=['platform', 'vendor_id', 'business_type', 'zipcode', 'cash', 'has_coupon', 'channel'])
@@ -109,26 +341,86 @@ def preprocess_all_data(dir_name, filename):
     return df_lstm
 
 
-def prepare_lstm_data(df, lookback=1, prediction_horizon=1):
+def sliding_windows(data, lookback=1, prediction_horizon=1, target=0, legacy=False):
     """
-    Preprocess data and prepare the input for LSTM.
+    Supervised windows of one or many series without copying the data (numpy sliding_window_view).
+    data is (time,) or (time, features) for one series, or (series, time, features) for many series of the same length.
+    Returns X, the lookback inputs (samples, lookback, features), and Y, the next prediction_horizon values
+    of the target feature (samples, prediction_horizon), both read-only views of data. Many series give
+    (series, samples, ...) views instead, reshape them to (-1, lookback, features) to train on all of them.
+    Every window with a complete target is kept, legacy=True keeps only the first time - 2*lookback windows
+    as the original loop of prepare_lstm_data did.
     """
 
-    X, Y = [], []
-    for i in range(lookback, len(df)-lookback):
-        X.append(df[i-lookback : i, 0])
-        Y.append(df[i : i + prediction_horizon, 0])
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data[:, None]
+    time_axis = data.ndim - 2
+
+    length = data.shape[time_axis]
+    samples = max(length - lookback - prediction_horizon + 1, 0)
+    if legacy:
+        samples = min(samples, max(length - 2 * lookback, 0))
+
+    if not samples:
+        batch = data.shape[:time_axis]
+        return (np.empty(batch + (0, lookback, data.shape[-1]), dtype=data.dtype),
+                np.empty(batch + (0, prediction_horizon), dtype=data.dtype))
+
+    # (..., windows, features, lookback) -> (..., windows, lookback, features)
+    X = np.lib.stride_tricks.sliding_window_view(data, lookback, axis=time_axis).swapaxes(-1, -2)
+    Y = np.lib.stride_tricks.sliding_window_view(data[..., lookback:, target], prediction_horizon, axis=-1)
+    return X[..., :samples, :, :], Y[..., :samples, :]
+
+def prepare_lstm_data(df, lookback=1, prediction_horizon=1, legacy=False):
+    """
+    Preprocess data and prepare the input for LSTM: (samples, lookback, features) inputs and
+    (samples, prediction_horizon) targets of the first column, see sliding_windows.
+    With legacy=True the last windows are dropped as in the original implementation.
+    """
+
+    X, Y = sliding_windows(df, lookback, prediction_horizon, legacy=legacy)
 
     logger.info("LSTM model input successfully constructed.")
     
-    return np.array(X), np.array(Y)
+    return X, Y
+
+
+def build_model(neurons, lookback=1, prediction_horizon=1, features=1):
+    """
+    LSTM model predicting the next prediction_horizon values from lookback days of features.
+    """
+
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, LSTM
+
+    model = Sequential()
+    model.add(LSTM(neurons, activation='relu', input_shape=(lookback, features)))
+    model.add(Dense(prediction_horizon))
+    model.compile(optimizer='adam', loss='mean_squared_error')
+    return model
 
+def save_model(model, col):
+    """
+    Save the model of col where the model registry reads it from, swapped in one step
+    so that the registry never reads a partial file. Returns the path of the saved model.
+    """
+
+    path = 'model_' + col + '.h5'
+    tmp_path = f'model_{col}.{os.getpid()}.tmp.h5'
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+    return os.path.join(os.getcwd(), path)
 
-def prepare_model(df, col, neurons, epochs, batch_size, lookback=1, prediction_horizon=1):
+def prepare_model(df, col, neurons, epochs, batch_size, lookback=1, prediction_horizon=1, callbacks=None):
     """
     Create the LSTM model and save it in h5d5 format.
+    Optional keras callbacks (e.g. progress reporting of a training job) are passed to model.fit.
     """
 
+    from sklearn.preprocessing import MinMaxScaler
+    from sklearn.metrics import mean_absolute_percentage_error
+
     data = df[col].values
     data = data.reshape((-1,1))
     data.shape
@@ -137,28 +429,27 @@ def prepare_model(df, col, neurons, epochs, batch_size, lookback=1, prediction_h
     train_size = int(len(data) * 0.7)
     train, test = data[:train_size], data[train_size:]
 
-    X_train, Y_train = prepare_lstm_data(train, lookback, prediction_horizon)
-    X_test, Y_test = prepare_lstm_data(test, lookback, prediction_horizon)
-
-    X_train = np.reshape(X_train, (X_train.shape[0], X_train.shape[1], 1))
-    X_test  = np.reshape(X_test, (X_test.shape[0], X_test.shape[1], 1))
+    # Windowing of the series, LSTM_WINDOWS=legacy in .env reproduces the models trained with the original loop
+    legacy = get_config('LSTM_WINDOWS', 'all') == 'legacy'
+    X_train, Y_train = prepare_lstm_data(train, lookback, prediction_horizon, legacy)
+    X_test, Y_test = prepare_lstm_data(test, lookback, prediction_horizon, legacy)
 
-    model = Sequential()
-    model.add(LSTM(neurons, activation='relu', input_shape=(X_train.shape[1], X_train.shape[2])))
-    model.add(Dense(prediction_horizon))
-    model.compile(optimizer='adam', loss='mean_squared_error')
+    model = build_model(neurons, X_train.shape[1], prediction_horizon, X_train.shape[2])
 
     print(model.summary())
 
-    history = model.fit(X_train, Y_train, 
-                        epochs=epochs, 
-                        batch_size=batch_size,
-                        verbose=0,
-                        shuffle=False)
+    with stage('model_fit', rows=len(X_train) * epochs):
+        history = model.fit(X_train, Y_train, 
+                            epochs=epochs, 
+                            batch_size=batch_size,
+                            verbose=0,
+                            shuffle=False,
+                            callbacks=callbacks)
 
-    model.save('model_' + col +'.h5')
+    save_model(model, col)
     # Make the predictions on the test set and compare them with the actual readings
-    test_predict  = model.predict(X_test)
+    with stage('model_predict', rows=len(X_test)):
+        test_predict  = model.predict(X_test)
 
     # Invert the predictions to original scale
     test_predict  = scaler.inverse_transform(test_predict)
@@ -169,49 +460,126 @@ def prepare_model(df, col, neurons, epochs, batch_size, lookback=1, prediction_h
     return Y_test, test_predict
 
 
-def predict_new_values(col, df):
+def model_name(col):
     """
-    Generalised function for future predictions. 
-    Predictions can be for total_orders for a given/or all customers, total_order_values for a given/or all customers.
+    Name of the saved LSTM model serving a column, e.g. '662229028:order_id' is served by model_order_id.h5.
     """
-    
-    # Load LSTM model
 
     if re.search("order_id", col):
-        model = load_model('model_' + 'order_id' +'.h5')
+        return 'order_id'
     elif re.search("total_order_value", col):
-        model = load_model('model_' + 'total_order_value' +'.h5')
-    else:
-        logger.error("No model found")
+        return 'total_order_value'
+    logger.error("No model found")
 
-    if ':' in col:
-        col = col.split(':')[0]
-    col = col.replace("'","")
+def minmax_scaling(data_min, data_max):
+    """
+    Vectorized MinMaxScaler(feature_range=(0,1)) for N series at once, returns the scale and offset of each series.
+    Constant series get a scale of 1, as in sklearn.
+    """
 
-    # Prepare the N-points future dataset
-    data = df[col].values
-    data = data.reshape((-1,1))
-    data.shape
-    scaler = MinMaxScaler(feature_range=(0,1))
-    data = scaler.fit_transform(data)
+    data_range = np.asarray(data_max, dtype=np.float64) - np.asarray(data_min, dtype=np.float64)
+    data_range[data_range < 10 * np.finfo(np.float64).eps] = 1.0
+    scale = 1.0 / data_range
+    offset = -np.asarray(data_min, dtype=np.float64) * scale
+    return scale, offset
+
+def forecast_mode():
+    """
+    How the forecasts roll the model forward, FORECAST_MODE in .env: recursive (one day per forward pass)
+    or direct (the whole PREDICTION_HORIZON output of each forward pass).
+    """
+
+    mode = get_config('FORECAST_MODE', 'recursive')
+    if mode not in ('recursive', 'direct'):
+        raise ValueError(f"Unknown FORECAST_MODE {mode}, expected recursive or direct")
+    return mode
+
+def forecast_batch(model, windows, data_min, data_max, num_prediction, mode='recursive'):
+    """
+    Autoregressive forecast of N series at once: windows is (N, LOOKBACK) in the original scale of each series.
+    Every step is one forward pass of the model over an (N, LOOKBACK, 1) tensor, chunked by INFERENCE_BATCH_SIZE.
+    The recursive mode keeps the first predicted day of each pass and feeds it back, num_prediction passes.
+    The direct mode keeps every day of the Dense(PREDICTION_HORIZON) output and feeds back whole blocks,
+    ceil(num_prediction / PREDICTION_HORIZON) passes.
+    Returns an (N, num_prediction+1) array with the last known value followed by the predictions, in original scale.
+    """
+
+    batch_size = get_config('INFERENCE_BATCH_SIZE', 8192, cast=int)
+    scale, offset = minmax_scaling(data_min, data_max)
+    scale, offset = scale[:, None], offset[:, None]
 
-    prediction_list = data[-LOOKBACK:]
-    num_prediction = get_config('NUM_PREDICTION', cast=int) 
+    history = np.zeros((len(windows), LOOKBACK + num_prediction))
+    history[:, :LOOKBACK] = np.asarray(windows) * scale + offset
 
+    with stage('model_predict', rows=len(windows)):
+        step = 0
+        while step < num_prediction:
+            x = history[:, step : step + LOOKBACK].reshape((-1, LOOKBACK, 1)).astype(np.float32)
+            days = 1
+            for begin in range(0, len(x), batch_size):
+                out = np.asarray(model(x[begin : begin + batch_size], training=False))
+                days = 1 if mode == 'recursive' else min(out.shape[1], num_prediction - step)
+                history[begin : begin + batch_size, LOOKBACK + step : LOOKBACK + step + days] = out[:, :days]
+            step += days
 
-    for _ in range(num_prediction):
-        x = prediction_list[-LOOKBACK:]
-        x = x.reshape((1, LOOKBACK, 1))
-        out = model.predict(x)[0][0]
-        prediction_list = np.append(prediction_list, out)
-    prediction_list = prediction_list[LOOKBACK-1:]
+    return (history[:, LOOKBACK-1:] - offset) / scale
 
-    prediction_list = prediction_list.reshape((-1,1))
-    prediction_list  = scaler.inverse_transform(prediction_list)
-    prediction_list = [i[0] for i in prediction_list]
+def predict_customers(col, store, customer_ids=None):
+    """
+    Batched future predictions of col for many customers of a CustomerSeriesStore, all of them by default.
+    Returns the prediction dates and an (N, NUM_PREDICTION+1) array, one row per customer as in predict_new_values.
+    """
+
+    name = model_name(col)
+    model = get_model(name)
+    num_prediction = get_config('NUM_PREDICTION', cast=int)
+
+    if customer_ids is None:
+        customer_ids = store.customer_ids
+    windows, data_min, data_max = store.windows(customer_ids, LOOKBACK)
+    mode = forecast_mode()
+    predictions = memoized_forecasts(name, registry.version(name), customer_ids, windows, data_min, data_max, store.last_date,
+                                     num_prediction, lambda *batch: forecast_batch(model, *batch, num_prediction, mode), mode)
+    prediction_dates = pd.date_range(store.last_date, periods=num_prediction+1).tolist()
+
+    logger.info(f"Batched predictions of {col} done for {len(predictions)} customers.")
+
+    return prediction_dates, predictions
+
+def predict_new_values(col, df, num_prediction=None):
+    """
+    Generalised function for future predictions. 
+    Predictions can be for total_orders for a given/or all customers, total_order_values for a given/or all customers.
+    The horizon defaults to NUM_PREDICTION in .env.
+    """
+    
+    # LSTM model, loaded once per worker
+    name = model_name(col)
+    model = get_model(name)
+
+    customer_id = 'all'
+    if ':' in col:
+        col = col.split(':')[0]
+        customer_id = col.replace("'","")
+    col = col.replace("'","")
+
+    # Prepare the N-points future dataset, either from a CustomerSeriesStore or from a dataframe column
+    if isinstance(df, CustomerSeriesStore):
+        window = df.window(col, LOOKBACK)
+        data_min, data_max = df.minmax(col)
+        last_date = df.last_date
+    else:
+        data = df[col].values
+        window = data[-LOOKBACK:]
+        data_min, data_max = data.min(), data.max()
+        last_date = df['created_at'].values[-1]
+
+    num_prediction = num_prediction or get_config('NUM_PREDICTION', cast=int)
+    mode = forecast_mode()
+    prediction_list = memoized_forecasts(name, registry.version(name), [customer_id], [window], [data_min], [data_max], last_date,
+                                         num_prediction, lambda *batch: forecast_batch(model, *batch, num_prediction, mode), mode)[0]
+    prediction_list = list(prediction_list)
 
-    last_date = df['created_at'].values[-1]
     prediction_dates = pd.date_range(last_date, periods=num_prediction+1).tolist()
 
     return prediction_dates, prediction_list 
-
@@ -1,14 +1,26 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-import io
 import csv
+import os
+import json
 
 from django.http import  HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework.response import Response
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view
 from exploration.constants import FILENAME, FILENAME_TOTAL_PER_CUSTOMER, DIR_NAME, COL_ORDERS, COL_EARNINGS, LOOKBACK, PREDICTION_HORIZON, FILENAME_ORDER_VALUES, FILENAME_ORDERS
-from exploration.utils import preprocess_all_data, prepare_model, predict_new_values, preprocess_per_customer_data
+from exploration.utils import preprocess_all_data, load_customer_series
+from exploration.results import ExportInProgress, export_predictions, results_path, stream_predictions
+from exploration.registry import registry
+from exploration.render_cache import async_cached_image_response, cached_image_response, dataset_fingerprint
+from exploration.charts import actual_vs_predicted_chart, forecast_chart, history_chart
+from exploration.forecasts import (FORECAST_FORMATS, forecast_parameters, forecast_frame, forecast_json, forecast_bytes,
+                                   customer_forecasts, parse_customer_ids)
+from exploration.ingest import IngestConflict, ingest_batch, read_batch
+from exploration.jobs import submit_training
+from exploration.precompute import export_stored_predictions, forecast_values, freshness_report
+from exploration.models import TrainingJob
+from exploration.serving import async_api_view, inference_executor, offload, offload_stream, stream_executor
 from core.utils import get_config
 
 import logging
@@ -16,162 +28,185 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-@api_view(['GET'])
-def data_viewer(request):
+@async_api_view(['GET'])
+async def data_viewer(request):
     """
     API request to view plots of the total orders per day, total earnings per day at all the customers
     """
 
-    df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
-    
-    fig = plt.figure(figsize=(16,6))
-    df_lstm.plot(x="created_at", y=["order_id", "total_order_value"])
-    buf = io.BytesIO()
-    plt.xticks(rotation=30)
-    plt.title('Total orders and earnings per day')
-    plt.savefig(buf, format='png', dpi=100)
-    plt.close(fig)
+    def render(fmt, dpi):
+        df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+        return history_chart(df_lstm['created_at'], {COL_ORDERS: df_lstm[COL_ORDERS], COL_EARNINGS: df_lstm[COL_EARNINGS]},
+                             'Total orders and earnings per day', fmt, dpi)
 
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    return response
+    return await async_cached_image_response(request, ('data_viewer', dataset_fingerprint(DIR_NAME, FILENAME)), render)
 
 
-@api_view(['GET'])
-def data_trainer_orders(request):
+async def training_response(request, col):
+    mode = request.GET.get('mode', TrainingJob.AGGREGATE)
+    if mode not in dict(TrainingJob.MODE_CHOICES):
+        return JsonResponse({'error': f"Unknown mode {mode}, expected aggregate or global"}, status=400)
+
+    # Keyed on the request, every call queues its own job
+    job = await offload(inference_executor, ('train', id(request)), submit_training, col, mode)
+    return JsonResponse(training_job_response(request, job), status=503 if job.status == TrainingJob.FAILED else 202)
+
+
+@async_api_view(['GET'])
+async def data_trainer_orders(request):
     """
-    API request to train a generalized LSTM model for the total orders per day for all the customers
+    API request to train a generalized LSTM model for the total orders per day for all the customers.
+    Training runs in the background worker pool, the response holds the id of the job to follow.
+    With ?mode=global the model is trained on the series of every customer instead of the daily totals.
     """
 
-    df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+    return await training_response(request, COL_ORDERS)
 
-    Y_test, test_predict = prepare_model(df_lstm, COL_ORDERS, 
-                                    get_config('NEURONS_GEN_ORDERS', cast=int),
-                                    get_config('EPOCHS_GEN_ORDERS', cast=int),
-                                    get_config('BATCH_SIZE_GEN_ORDERS', cast=int),  
-                                    lookback=LOOKBACK, 
-                                    prediction_horizon=PREDICTION_HORIZON)
-    
-    actual = Y_test[:][0]
-    predicted = test_predict[:][0] 
 
-    fig = plt.figure(figsize=(16,6))
-    plt.plot(actual, label='Actual orders')
-    plt.plot(predicted, label='Predicted orders')
-    buf = io.BytesIO()
+@async_api_view(['GET'])
+async def data_trainer_earnings(request):
+    """
+    API request to train a generalized LSTM model for the total order values per day for all the customers.
+    Training runs in the background worker pool, the response holds the id of the job to follow.
+    With ?mode=global the model is trained on the series of every customer instead of the daily totals.
+    """
 
-    plt.ylabel('Orders', size=13)
-    plt.xlabel('Time Step (Days)', size=13)
-    plt.tight_layout()
-    plt.legend(fontsize=13)
-    plt.savefig(buf, format='png', dpi=100)
-    plt.close(fig)
+    return await training_response(request, COL_EARNINGS)
 
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    return response          
+
+def training_job_response(request, job):
+    response_data = job.as_dict()
+    response_data['status_url'] = request.build_absolute_uri(reverse('training_job_status', args=[job.pk]))
+    response_data['plot_url'] = request.build_absolute_uri(reverse('training_job_plot', args=[job.pk]))
+    return response_data
 
 
 @api_view(['GET'])
-def data_trainer_earnings(request):
+def training_job_status(request, job_id):
     """
-    API request to train a generalized LSTM model for the total order values per day for all the customers
+    API request to follow a training job: status, current epoch, MAPE on the test set and path of the saved model.
     """
 
-    df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+    job = get_object_or_404(TrainingJob, pk=job_id)
+    return JsonResponse(training_job_response(request, job))
 
-    Y_test, test_predict = prepare_model(df_lstm, COL_EARNINGS, 
-                                       get_config('NEURONS_GEN_EARNINGS', cast=int), 
-                                       get_config('EPOCHS_GEN_EARNINGS', cast=int),
-                                       get_config('BATCH_SIZE_GEN_EARNINGS', cast=int), 
-                                       lookback=LOOKBACK, 
-                                       prediction_horizon=PREDICTION_HORIZON)
-    
-    actual = Y_test[:][0]
-    predicted = test_predict[:][0]
 
-    fig = plt.figure(figsize=(16,6))
-    plt.plot(actual, label='Actual earnings')
-    plt.plot(predicted, label='Predicted earnings')
-    buf = io.BytesIO()
+@api_view(['GET'])
+def training_job_plot(request, job_id):
+    """
+    API request to view the plot of the LSTM training/testing phase of a finished training job.
+    """
 
-    plt.ylabel('Orders', size=13)
-    plt.xlabel('Time Step (Days)', size=13)
-    plt.tight_layout()
-    plt.legend(fontsize=13)
-    plt.savefig(buf, format='png', dpi=100)
-    plt.close(fig)
+    job = get_object_or_404(TrainingJob, pk=job_id)
+    if job.status != TrainingJob.SUCCEEDED:
+        return JsonResponse(training_job_response(request, job), status=409)
 
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    return response 
+    label = 'orders' if job.col == COL_ORDERS else 'earnings'
 
-@api_view(['GET'])
-def data_predict_orders(request):
+    def render(fmt, dpi):
+        return actual_vs_predicted_chart(job.actual, job.predicted, label, fmt, dpi)
+
+    return cached_image_response(request, ('training_job_plot', job.pk, job.finished_at.isoformat()), render)
+
+@async_api_view(['GET'])
+async def data_predict_orders(request):
     """
     API request to predict for the total orders per day for all the customers at N points ahead in time, 
     N is configurable in .env through the parameter NUM_PREDICTION. 
     """
 
-    df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+    def render(fmt, dpi):
+        df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+        prediction_dates, prediction_list = forecast_values(FILENAME, COL_ORDERS, lambda: df_lstm)
+        prediction_list = [int(i) for i in prediction_list]
+        return forecast_chart(df_lstm['created_at'], df_lstm[COL_ORDERS], prediction_dates, prediction_list, COL_ORDERS,
+                              'Predicted orders untill the end of March 2019', fmt, dpi)
 
-    prediction_dates, prediction_list = predict_new_values(COL_ORDERS, df_lstm)
-    prediction_list=[int(i) for i in prediction_list]
+    key = ('data_predict_orders', dataset_fingerprint(DIR_NAME, FILENAME), registry.version(COL_ORDERS),
+           get_config('NUM_PREDICTION', cast=int))
+    return await async_cached_image_response(request, key, render)
 
+@async_api_view(['GET'])
+async def data_predict_earnings(request):
+    """
+    API request to predict for the total values of orders per day for all the customers at N points ahead in time, 
+    N is configurable in .env through the parameter NUM_PREDICTION. 
+    """
 
-    df_pred = pd.DataFrame([prediction_dates,prediction_list]) #Each list would be added as a row
-    df_pred = df_pred.transpose() #To Transpose and make each rows as columns
-    df_pred.columns=['created_at', COL_ORDERS] #Rename the columns
-    df_total = pd.concat([df_lstm, df_pred], axis=0)
+    def render(fmt, dpi):
+        df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+        prediction_dates, prediction_list = forecast_values(FILENAME, COL_EARNINGS, lambda: df_lstm)
+        return forecast_chart(df_lstm['created_at'], df_lstm[COL_EARNINGS], prediction_dates, prediction_list, COL_EARNINGS,
+                              'Predicted earnings untill the end of March 2019', fmt, dpi)
 
-    fig = plt.figure(figsize=(16,6))
-    df_total.plot(x="created_at", y=COL_ORDERS)
-    buf = io.BytesIO()
-    plt.xticks(rotation=30)
-    plt.title('Predicted orders untill the end of March 2019')
-    plt.savefig(buf, format='png', dpi=100)
-    plt.close(fig)
+    key = ('data_predict_earnings', dataset_fingerprint(DIR_NAME, FILENAME), registry.version(COL_EARNINGS),
+           get_config('NUM_PREDICTION', cast=int))
+    return await async_cached_image_response(request, key, render)
 
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    return response
+def forecast_body(col, params):
+    frame = forecast_frame(col, params['horizon'], params['start'], params['end'], params['history'])
+    if params['fmt'] == 'json':
+        return forecast_json(col, frame)
+    return forecast_bytes(frame, params['fmt'])
 
-@api_view(['GET'])
-def data_predict_earnings(request):
+
+async def forecast_response(request, col):
     """
-    API request to predict for the total values of orders per day for all the customers at N points ahead in time, 
-    N is configurable in .env through the parameter NUM_PREDICTION. 
+    Forecast of col without rendering: json by default, csv or an Arrow IPC stream with ?output=csv|arrow.
+    ?horizon= sets the number of days predicted, ?start= and ?end= (YYYY-MM-DD) the date range returned,
+    ?history=1 adds the known days before the predictions.
     """
 
-    df_lstm = preprocess_all_data(DIR_NAME, FILENAME)
+    try:
+        params = forecast_parameters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    body = await offload(inference_executor, ('forecast', col, tuple(sorted(params.items()))), forecast_body, col, params)
+    if params['fmt'] == 'json':
+        return JsonResponse(body)
+    return HttpResponse(body, content_type=FORECAST_FORMATS[params['fmt']])
 
-    prediction_dates, prediction_list = predict_new_values(COL_EARNINGS, df_lstm)
 
-    df_pred = pd.DataFrame([prediction_dates,prediction_list]) #Each list would be added as a row
-    df_pred = df_pred.transpose() #To Transpose and make each rows as columns
-    df_pred.columns=['created_at', COL_EARNINGS] #Rename the columns
-    df_total = pd.concat([df_lstm, df_pred], axis=0)
+@async_api_view(['GET'])
+async def data_forecast_orders(request):
+    """
+    API request returning the predicted total orders per day for all the customers as data (json, csv or arrow).
+    """
 
-    fig = plt.figure(figsize=(16,6))
-    df_total.plot(x="created_at", y=COL_EARNINGS)
-    buf = io.BytesIO()
-    plt.xticks(rotation=30)
-    plt.title('Predicted earnings untill the end of March 2019')
-    plt.savefig(buf, format='png', dpi=100)
-    plt.close(fig)
+    return await forecast_response(request, COL_ORDERS)
 
-    response = HttpResponse(buf.getvalue(), content_type='image/png')
-    return response    
 
-@api_view(['GET'])
-def data_predict_per_customer(request):
+@async_api_view(['GET'])
+async def data_forecast_earnings(request):
+    """
+    API request returning the predicted total earnings per day for all the customers as data (json, csv or arrow).
+    """
+
+    return await forecast_response(request, COL_EARNINGS)
+
+
+def configured_customer_predictions(customer_orders, customer_values):
+    # Precomputed forecasts when fresh, the series are only loaded to compute the missing ones
+    prediction_dates, prediction_list_orders = forecast_values(FILENAME_ORDERS, customer_orders,
+                                                               lambda: load_customer_series(DIR_NAME, FILENAME_ORDERS, COL_ORDERS, 'count'))
+    prediction_dates, prediction_list_values = forecast_values(FILENAME_ORDER_VALUES, customer_values,
+                                                               lambda: load_customer_series(DIR_NAME, FILENAME_ORDER_VALUES, COL_EARNINGS, 'sum'))
+    return prediction_list_orders, prediction_list_values
+
+
+@async_api_view(['GET'])
+async def data_predict_per_customer(request):
     """
     API request to predict the sum of orders and values per given customer at N points ahead in time, 
     N is configurable in .env through the parameter NUM_PREDICTION. 
+    The customers are the ones set in .env, see customer_forecast and customer_forecasts to look up any customer.
     """
 
-    df_orders = preprocess_per_customer_data(DIR_NAME, FILENAME_ORDERS, COL_ORDERS, 'count')
-    df_values = preprocess_per_customer_data(DIR_NAME, FILENAME_ORDER_VALUES, COL_EARNINGS, 'sum')
-
-    
-    prediction_dates, prediction_list_orders = predict_new_values(get_config('CUSTOMER_order_id'), df_orders)
-    prediction_dates, prediction_list_values = predict_new_values(get_config('CUSTOMER_total_order_value'), df_values)
+    customer_orders, customer_values = get_config('CUSTOMER_order_id'), get_config('CUSTOMER_total_order_value')
+    prediction_list_orders, prediction_list_values = await offload(
+        inference_executor, ('data_predict_per_customer', customer_orders, customer_values),
+        configured_customer_predictions, customer_orders, customer_values)
 
     prediction_list_orders=[int(i) for i in prediction_list_orders]
 
@@ -185,57 +220,141 @@ def data_predict_per_customer(request):
             'customer_id_values': get_config('CUSTOMER_total_order_value'),
             'total_predicted_values': sum(prediction_list_values),
         }
-    
-    #Export to file
-    customer_list = [get_config('CUSTOMER_order_id',cast=str), get_config('CUSTOMER_total_order_value',cast=str)]    
-    order_results_list = [sum(prediction_list_orders), sum(prediction_list_orders)]
-    values_results_list =[sum(prediction_list_values), sum(prediction_list_values)] 
-    pd.DataFrame({'customer_id':customer_list,'orders_predictions':order_results_list,'values_predictions':values_results_list}).to_csv('results.csv')
-    
+
     return JsonResponse(response_data)
 
-@api_view(['GET'])
-def data_predict_per_customer_all_returning_customers(request):
+
+@async_api_view(['GET'])
+async def customer_forecast(request, customer_id):
+    """
+    API request to predict the orders and values of one customer at N points ahead in time, N is NUM_PREDICTION in .env.
+    """
+
+    try:
+        customer_ids = parse_customer_ids([customer_id])
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response_data = await offload(inference_executor, ('customers', tuple(customer_ids)), customer_forecasts, customer_ids)
+    if not response_data['customers']:
+        return JsonResponse({'error': f"Unknown customer_id {customer_id}"}, status=404)
+    return JsonResponse(response_data)
+
+
+@async_api_view(['GET', 'POST'])
+async def customer_forecasts_batch(request):
+    """
+    API request to predict the orders and values of several customers at N points ahead in time,
+    ?customer_id=1,2 or a json body {"customer_ids": [1, 2]} posted. Only the requested customers are scored.
+    """
+
+    try:
+        if request.method == 'POST':
+            data = json.loads(request.body or b'{}')
+            customer_ids = data.get('customer_ids', []) if isinstance(data, dict) else []
+            if not isinstance(customer_ids, list):
+                customer_ids = [customer_ids]
+        else:
+            customer_ids = request.GET.getlist('customer_id')
+        customer_ids = parse_customer_ids(customer_ids)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse(await offload(inference_executor, ('customers', tuple(customer_ids)), customer_forecasts, customer_ids))
+
+def export_all_customers(restart):
+    stored = export_stored_predictions(FILENAME_ORDERS)
+    if stored is not None:
+        (path, scored), resumed = stored, 0
+    else:
+        # Predictions are appended to the results file as they are produced, an interrupted run resumes unless restart
+        path, scored, resumed = export_predictions(DIR_NAME, FILENAME_ORDERS, resume=not restart)
+
+    logger.info(f"Predictions for all customers have finished")
+
+    return {
+            'predictions': 'successfully done',
+            'results': path,
+            'scored_customers': scored,
+            'resumed_customers': resumed,
+            'precomputed': stored is not None,
+    }
+
+
+@async_api_view(['GET'])
+async def data_predict_per_customer_all_returning_customers(request):
     """
     API request to predict the sum of orders and values per given customer, for all returning customers, at N points ahead in time, 
     N is configurable in .env through the parameter NUM_PREDICTION.
-    This view supports for now a minimal list of customers and it needs to be improved using spark compute power in order to 
-    deliver results for all the customer portfolio. 
+    Customers are split in PREDICTION_SHARDS shards scored by PREDICTION_WORKERS processes, configurable in .env.
+    When the precomputed forecasts are fresh, the results file is written from the Forecast table instead.
+    Concurrent calls share one export, and an export of another process (score_customers) answers 409.
+    """
+
+    restart = request.GET.get('restart') == '1'
+    # Keyed on the results file only: a restart arriving during an export joins it instead of truncating its file
+    path = os.path.abspath(results_path(get_config('RESULTS_FORMAT', 'csv')))
+    try:
+        response_data = await offload(inference_executor, ('export', path), export_all_customers, restart)
+    except ExportInProgress as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+    return JsonResponse(response_data)
+
+
+@async_api_view(['GET'])
+async def data_predict_per_customer_stream(request):
+    """
+    API request streaming the predictions of all returning customers while they are produced,
+    as csv by default or as newline delimited json with ?output=ndjson.
+    At most STREAM_THREADS streams run at once, further requests get a 503.
     """
 
-    df_orders = preprocess_per_customer_data(DIR_NAME, FILENAME_ORDERS, COL_ORDERS, 'count')
-    df_values = preprocess_per_customer_data(DIR_NAME, FILENAME_ORDERS, COL_EARNINGS, 'sum')
+    fmt = request.GET.get('output', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return JsonResponse({'error': f"Unknown output {fmt}, expected csv or ndjson"}, status=400)
 
-    # Create a list with all returning customers from the labels of the dataframe and drop the first column which is the date
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    chunks = offload_stream(stream_executor, stream_predictions(DIR_NAME, FILENAME_ORDERS, fmt))
+    return StreamingHttpResponse(chunks, content_type=content_type)
 
-    columnsNamesArr = list(df_orders.columns.values)
-    columnsNamesArr = columnsNamesArr[1:]
 
-    order_results_list = []
-    values_results_list = []
+def ingest_body(body, fmt):
+    return ingest_batch(DIR_NAME, read_batch(body.decode('utf-8'), fmt))
 
-    for customer in columnsNamesArr:
-        prediction_dates, prediction_list_orders = predict_new_values(customer+':order_id', df_orders)
-        prediction_list_orders=[int(i) for i in prediction_list_orders]
-        logger.info(f"Predictions done for N customers {customer}")                    
 
-        count_orders = sum(prediction_list_orders)
-        order_results_list.append(count_orders) 
+@async_api_view(['POST'])
+async def data_ingest_orders(request):
+    """
+    API request appending a batch of order rows to the input csv, as csv with a header or as newline delimited json
+    (Content-Type application/x-ndjson). The cached aggregates are updated for the affected days and customers only,
+    the orders of the customers of the per customer files are appended to them too.
+    """
 
-        prediction_dates, prediction_list_values = predict_new_values(customer+':total_order_value', df_values)
-        logger.info(f"Predictions done for customer {customer}")                    
+    fmt = 'ndjson' if 'json' in request.content_type else 'csv'
+    try:
+        # Keyed on the request, every batch is ingested
+        summary = await offload(inference_executor, ('ingest', id(request)), ingest_body, request.body, fmt)
+    except IngestConflict as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(summary)
 
-        sum_values = sum(prediction_list_values)
-        values_results_list.append(sum_values)
 
-    logger.info(f"Predictions for all customers have finished")
+@api_view(['GET'])
+def forecast_freshness(request):
+    """
+    API request to view how fresh the precomputed forecasts are, per input file and metric.
+    """
 
-    #Export to file
-    pd.DataFrame({'customer_id':columnsNamesArr,'orders_predictions':order_results_list,'values_predictions':values_results_list}).to_csv('results.csv')
-    
-    # Response data in json
-    response_data = {
-            'predictions': 'successfully done'
-    }
+    return JsonResponse(freshness_report())
+
+
+@api_view(['GET'])
+def model_registry(request):
+    """
+    API request to view the version and load timestamp of the LSTM models served by this worker.
+    """
 
-    return JsonResponse(response_data) 
\ No newline at end of file
+    return JsonResponse(registry.info())
@@ -0,0 +1,68 @@
+import os
+
+import django
+from threadpoolctl import threadpool_limits
+
+from core.utils import get_config
+from exploration.constants import COL_ORDERS, COL_EARNINGS
+from exploration.registry import get_model
+
+
+# Initializers of the spawned worker processes. This module is imported by a fresh process before Django is set up,
+# so it must not import the Django models (directly or through exploration.jobs/views).
+
+# Thread limits of a scoring process, kept for the lifetime of the process
+_thread_limits = None
+
+# Daily series shared by all the trials of a sweep process, and the best validation loss shared by all the processes
+sweep_data = None
+sweep_best = None
+
+
+def init_worker():
+    """
+    Set up Django in a freshly spawned worker process.
+    """
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+
+
+def limit_threads(tensorflow=True):
+    """
+    One thread per process for numpy and tensorflow, so that the processes of a pool do not oversubscribe the cores.
+    """
+
+    global _thread_limits
+
+    _thread_limits = threadpool_limits(1)
+    if tensorflow:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(1)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def init_prediction_worker():
+    """
+    Set up a scoring process: one thread per process for numpy and tensorflow, so that the workers
+    do not oversubscribe the cores, and both models loaded once for all the shards of the process.
+    """
+
+    init_worker()
+    limit_threads(get_config('INFERENCE_BACKEND', 'keras') == 'keras')
+
+    get_model(COL_ORDERS)
+    get_model(COL_EARNINGS)
+
+
+def init_sweep_worker(data, best):
+    """
+    Set up a sweep process: one thread per process, the daily series loaded once by the parent for all the trials
+    and the shared best validation loss used to stop unpromising trials.
+    """
+
+    global sweep_data, sweep_best
+
+    init_worker()
+    limit_threads()
+    sweep_data, sweep_best = data, best
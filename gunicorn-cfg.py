@@ -1,6 +1,8 @@
 # -*- encoding: utf-8 -*-
 
 
+# Serves the ASGI application: gunicorn core.asgi:application -c gunicorn-cfg.py
+worker_class = 'uvicorn.workers.UvicornWorker'
 bind = '0.0.0.0:8000'
 timeout = 600
 workers = 1
@@ -9,3 +11,13 @@ accesslog = '-'
 loglevel = 'debug'
 capture_output = True
 enable_stdio_inheritance = True
+
+
+def post_worker_init(worker):
+    # Runs in each worker once the application is loaded and before it accepts requests: fail the training jobs
+    # of a previous web process, then load the models and the cached datasets listed in WARMUP (.env),
+    # so that the first requests are not slow
+    from exploration.jobs import recover_jobs
+    from exploration.startup import warm_up
+    recover_jobs()
+    warm_up()